@@ -33,10 +33,13 @@ NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF THE USE OF THIS
 SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
 """
 
-from twisted.internet import reactor, protocol, ssl, task
+from twisted.internet import reactor, protocol, ssl, task, defer, threads
 from twisted.internet.protocol import Protocol, ReconnectingClientFactory
+try: from twisted.internet import inotify # Linux only
+except ImportError: inotify = None
 from twisted.words.protocols import irc
-from twisted.python import filepath, log
+from twisted.python import filepath, log, failure
+from twisted.python.threadpool import ThreadPool
 from twisted.python.logfile import DailyLogFile
 from twisted.application import internet, service
 import site     # to help find botconf
@@ -48,9 +51,16 @@ import os       # for check path exists (dumplogs), and chmod
 import stat     # for chmod mode bits
 import re       # for hello, and other things.
 import urllib   # for dealing with NH4 variants' #&$#@ spaces in filenames.
-import shelve   # for persistent !tell messages
+import shelve   # for !setmintc and the rumors cache
+import sqlite3  # for persistent !tell messages
+import pickle   # for the statistics snapshot
 import random   # for !rng and friends
-import glob     # for matching in !whereis
+import string   # for compiling the dumplog templates
+import collections # for the announcement backlog
+import array    # for the compact ascension counters
+import heapq    # for !slow
+import multiprocessing # for parallel xlogfile replay at startup
+import concurrent.futures
 import requests # for !rumor
 import xml.etree.ElementTree as ET  # for RSS parsing
 from email.utils import parsedate_to_datetime  # for RSS pubDate parsing
@@ -58,11 +68,13 @@ from email.utils import parsedate_to_datetime  # for RSS pubDate parsing
 # Configuration constants for timeouts and limits
 QUERY_TIMEOUT = 5  # Timeout for queries in seconds
 MAX_VARIANT_CHOICES = 10  # Maximum random variant choices
-LOG_CHECK_INTERVAL = 3  # How often to check log files (seconds)
+LOG_CHECK_INTERVAL = 3  # How often to check log files when inotify is unavailable (seconds)
+LOG_SWEEP_INTERVAL = 60 # How often to double-check log files when inotify is watching (seconds)
 FILE_MONITOR_INTERVAL = 1  # How often to check for file changes (seconds)
 MAX_QUERIES = 100  # Maximum concurrent queries to prevent memory leaks
 REDDIT_MAX_POST_AGE = 600  # Only announce Reddit posts younger than 10 minutes
 MAX_TELLBUF_MESSAGES = 1000  # Maximum total tell messages stored
+MAX_PENDING_ANNOUNCEMENTS = 100  # Announcements held while disconnected from IRC
 RATE_LIMIT_WINDOW = 60  # Rate limiting time window in seconds
 RATE_LIMIT_COMMANDS = 60   # Commands per minute for all operations (1/second)
 BURST_WINDOW = 1        # Burst protection: only 1 command per second window
@@ -71,16 +83,29 @@ ABUSE_WINDOW = 30       # Time window for abuse detection (seconds)
 ABUSE_PENALTY = 900     # Abuse penalty duration in seconds (15 minutes)
 RESPONSE_RATE_LIMIT = 1   # Max penalty messages per 2 minutes to prevent spam
 RESPONSE_RATE_WINDOW = 120  # Penalty message rate limit window (2 minutes)
+RATE_LIMIT_HOSTS = 10000    # Most hosts tracked for rate limiting; least recently active go first
+STATS_SNAPSHOT_INTERVAL = 600  # How often to checkpoint statistics to disk (seconds)
+STATS_SNAPSHOT_VERSION = 5     # Bump when the snapshot layout changes
+PERF_LAG_INTERVAL = 1   # How often to measure reactor lag (seconds)
+PERF_SAMPLES = 1000     # Timings kept per category for percentiles, and for !slow
+PERF_SLOW_REPORT = 5    # Operations listed by !slow
+HTTP_THREADS = 4        # Threads for blocking HTTP fetches (rumors, Reddit)
+HTTP_TIMEOUT = 10       # Timeout for each HTTP fetch (seconds)
+RUMOR_CACHE_TTL = 3600  # Age at which a cached rumors file is revalidated (seconds)
+RUMOR_RETRY_INTERVAL = 300  # Wait before revalidating again after a failure (seconds)
+CHANLOG_FLUSH_INTERVAL = 2    # Longest a channel log line waits in memory (seconds)
+CHANLOG_BUFFER_MAX = 8192     # Flush the channel log sooner once this much is waiting (chars)
+DUMPLOG_CACHE_TTL = 60  # How long to trust a dumplog existence check (seconds)
+DUMPLOG_CACHE_MAX = 10000 # Existence checks cached before expired ones are dropped
 
 # Pre-compiled regex patterns for better performance
-RE_COLOR_FG_BG = re.compile(r'\x03\d\d,\d\d')  # fg,bg pair
-RE_COLOR_FG = re.compile(r'\x03\d\d')  # fg only
-RE_COLOR_END = re.compile(r'[\x1D\x03\x0f]')  # end of colour and italics
+RE_COLOR = re.compile(r'\x03\d\d(?:,\d\d)?|[\x1D\x03\x0f]')  # colour (fg or fg,bg), end of colour and italics
 RE_DICE_CMD = re.compile(r'^\d*d$')  # !d, !4d is rubbish input
 RE_DIGITS = re.compile(r'^\d+$')  # match only digits
 RE_DICE_FULL = re.compile(r'^\d*d\d*$')  # full dice pattern
 RE_HELLO = re.compile(r'^(hello|hi|hey|salut|hallo|guten tag|shalom|ciao|hola|aloha|bonjour|hei|gday|konnichiwa|nuqneh)[!?. ]*$', re.IGNORECASE)
 RE_SPACE_COLOR = re.compile(r'^ [\x1D\x03\x0f]*')  # space and color codes
+RE_DIGEST_ROLE = re.compile(r' \(\S+ \S+ \S+ \S+\)')  # (Val Hum Fem Law), dropped from digests
 
 site.addsitedir('.')
 from botconf import HOST, PORT, CHANNEL, NICK, USERNAME, REALNAME, BOTDIR
@@ -99,6 +124,14 @@ try: from botconf import ENABLE_REDDIT
 except: ENABLE_REDDIT = False
 try: from botconf import PERMANENT_MINTC
 except: PERMANENT_MINTC = {}
+try: from botconf import REPLAY_WORKERS
+except: REPLAY_WORKERS = 0
+try: from botconf import OUTBOUND_RATE
+except: OUTBOUND_RATE = 0
+try: from botconf import OUTBOUND_BURST
+except: OUTBOUND_BURST = 5
+try: from botconf import DIGEST_THRESHOLD
+except: DIGEST_THRESHOLD = 0
 try:
     from botconf import REMOTES
 except:
@@ -156,24 +189,1248 @@ def sanitize_format_string(text):
         return text
     return text.replace('{', '{{').replace('}', '}}')
 
-def parse_xlogfile_line(line, delim):
-    record = {}
-    # Fields that contain user-controlled text that could be used in format strings
-    user_controlled_fields = {'name', 'charname', 'death', 'killer', 'wish',
-                              'shout', 'genocided_monster', 'bones_killed',
-                              'bones_monst', 'killed_uniq', 'defeated',
-                              'shopkeeper', 'killed_shopkeeper'}
+# Fields that contain user-controlled text that could be used in format strings
+xlogfile_user_fields = frozenset(("name", "charname", "death", "killer", "wish",
+                                  "shout", "genocided_monster", "bones_killed",
+                                  "bones_monst", "killed_uniq", "defeated",
+                                  "shopkeeper", "killed_shopkeeper"))
+
+# Fields xlogfileReport reads for every line, including the ones it only
+# replays for stats at startup. These are converted as soon as the line is
+# parsed; everything else stays raw until somebody asks for it.
+xlogfile_hot_fields = frozenset(("name", "death", "role", "race", "gender", "align",
+                                 "starttime", "endtime", "flags", "turns", "points",
+                                 "version", "mode", "modes", "dumplog"))
+
+def convert_xlogfile_field(key, value):
+    """Convert one raw xlogfile field value"""
+    if key in xlogfile_parse:
+        return xlogfile_parse[key](value)
+    # Sanitize user-controlled fields to prevent format string injection
+    if key in xlogfile_user_fields:
+        return sanitize_format_string(value)
+    return value
+
+class GameRecord:
+    """A parsed xlogfile (or livelog) line.
+
+    The hot fields, and the ones the bot adds while reporting, are slots so
+    the stats code can read them as attributes without a dict per line. The
+    rest of the line is kept as raw strings in self.raw and converted the
+    first time it is looked up. Item access (record["turns"], "wish" in
+    record, get(), format_map()) works on all of it, as it did when this was
+    a plain dict; asdict() builds a real dict for the lines that actually
+    get announced.
+    """
+    slotted = xlogfile_hot_fields | {"variant", "dumplogs", "displaystring", "ascsuff",
+                                     "asc_dumpurl", "wallclock", "duration_str"}
+    __slots__ = tuple(sorted(slotted)) + ("raw", "extra")
+
+    def __init__(self):
+        self.raw = {}
+        self.extra = None # converted non-slot fields, created on demand
+
+    def __getitem__(self, key):
+        if key in self.slotted:
+            try:
+                return getattr(self, key)
+            except AttributeError:
+                raise KeyError(key) from None
+        if self.extra is None:
+            self.extra = {}
+        elif key in self.extra:
+            return self.extra[key]
+        value = self.extra[key] = convert_xlogfile_field(key, self.raw.pop(key))
+        return value
+
+    def __setitem__(self, key, value):
+        if key in self.slotted:
+            setattr(self, key, value)
+            return
+        if self.extra is None:
+            self.extra = {}
+        self.extra[key] = value
+        self.raw.pop(key, None)
+
+    def __contains__(self, key):
+        if key in self.slotted:
+            return hasattr(self, key)
+        return key in self.raw or (self.extra is not None and key in self.extra)
 
+    def get(self, key, default=None):
+        try:
+            return self[key]
+        except KeyError:
+            return default
+
+    def keys(self):
+        return self.asdict().keys()
+
+    def asdict(self):
+        """All fields as a plain dict, converting whatever is still raw"""
+        record = {key: getattr(self, key) for key in self.slotted if hasattr(self, key)}
+        for key, value in self.raw.items():
+            record[key] = convert_xlogfile_field(key, value)
+        if self.extra:
+            record.update(self.extra)
+        return record
+
+def parse_xlogfile_line(line, delim):
+    record = GameRecord()
+    raw = record.raw
+    # decoding the line once is much cheaper than decoding field by field
     for field in line.strip().decode(encoding='UTF-8', errors='ignore').split(delim):
         key, _, value = field.partition("=")
-        if key in xlogfile_parse:
-            value = xlogfile_parse[key](value)
-        # Sanitize user-controlled fields to prevent format string injection
-        elif key in user_controlled_fields:
-            value = sanitize_format_string(value)
-        record[key] = value
+        if key in xlogfile_hot_fields:
+            setattr(record, key, convert_xlogfile_field(key, value))
+        else:
+            raw[key] = value
     return record
 
+class LogWatcher:
+    """Call back with a log file's FilePath whenever that file is written to.
+
+    Uses inotify where available, so nothing happens until a game writes a
+    line. The directories holding the files are watched too, so a file that
+    is deleted and recreated (or renamed into place) is watched again as
+    soon as it appears. A single stat() sweep backs it up: every
+    LOG_SWEEP_INTERVAL seconds to catch anything inotify missed, or every
+    LOG_CHECK_INTERVAL seconds as the only mechanism when inotify is absent.
+    """
+    if inotify:
+        watchMask = (inotify.IN_MODIFY | inotify.IN_ATTRIB
+                     | inotify.IN_MOVE_SELF | inotify.IN_DELETE_SELF)
+        goneMask = inotify.IN_MOVE_SELF | inotify.IN_DELETE_SELF | inotify.IN_IGNORED
+        dirMask = inotify.IN_CREATE | inotify.IN_MOVED_TO
+
+    def __init__(self, callback):
+        self.callback = callback
+        self.stats = {}      # filepath -> (inode, size, mtime) at last look
+        self.watched = set() # filepaths with a live inotify watch
+        self.dirs = set()    # their parent directories, watched for new files
+        self.dirty = set()   # filepaths written since the last callback run
+        self.files = {}      # inotify reports bytes-mode paths; map them back
+        self.notifier = None
+        self.sweeper = None
+
+    @property
+    def mode(self):
+        return "inotify" if self.notifier else "polling"
+
+    def start(self, filepaths):
+        for filepath in filepaths:
+            self.files[filepath.asBytesMode()] = filepath
+            self.stats[filepath] = self._stat(filepath)
+        if inotify:
+            self._startNotifier()
+        interval = LOG_SWEEP_INTERVAL if self.notifier else LOG_CHECK_INTERVAL
+        self.sweeper = task.LoopingCall(self.sweep)
+        self.sweeper.start(interval, now=False)
+
+    def stop(self):
+        if self.sweeper and self.sweeper.running:
+            self.sweeper.stop()
+        if self.notifier:
+            self.notifier.loseConnection()
+            self.notifier = None
+        self.watched.clear()
+        self.dirs.clear()
+
+    def _startNotifier(self):
+        try:
+            self.notifier = inotify.INotify()
+            self.notifier.startReading()
+        except Exception as e:
+            tlog(f"inotify unavailable, polling logs instead: {e}")
+            self.notifier = None
+        self.watched.clear()
+        self.dirs.clear()
+        for filepath in self.stats:
+            self._watchDir(filepath.parent())
+            self._watch(filepath)
+
+    def _stat(self, filepath):
+        try:
+            st = os.stat(filepath.path)
+        except OSError:
+            return None
+        return (st.st_ino, st.st_size, st.st_mtime_ns)
+
+    def _watch(self, filepath):
+        if not self.notifier or filepath in self.watched: return
+        try:
+            self.notifier.watch(filepath, mask=self.watchMask,
+                                callbacks=[self._notified])
+            self.watched.add(filepath)
+        except Exception:
+            pass # missing file; its directory's watch says when it appears
+
+    def _watchDir(self, dirpath):
+        if not self.notifier or dirpath in self.dirs: return
+        try:
+            self.notifier.watch(dirpath, mask=self.dirMask,
+                                callbacks=[self._notified])
+            self.dirs.add(dirpath)
+        except Exception:
+            pass # missing directory; the sweep will have to do
+
+    def _notified(self, ignored, filepath, mask):
+        # events on the directories name the file created or moved there,
+        # so everything but our log files drops out here
+        filepath = self.files.get(filepath)
+        if filepath is None: return
+        if mask & (self.goneMask | self.dirMask):
+            # file was moved, deleted or replaced, so the watch is dead.
+            # _flush re-watches whatever took its place.
+            self.watched.discard(filepath)
+        self._changed(filepath)
+
+    def _rewatch(self, filepath):
+        if not self.notifier.connected:
+            # INotify shuts itself down when a watched file is deleted
+            # (as a file renamed over it is), taking every watch with it
+            tlog("inotify watcher closed, restarting it")
+            self._startNotifier()
+            return
+        # INotify still maps the path to the old watch, which follows a
+        # moved inode; forget it so the path is watched afresh
+        self.watched.discard(filepath)
+        try:
+            self.notifier.ignore(filepath)
+        except Exception:
+            pass # already dropped along with a deleted inode
+        self._watch(filepath)
+
+    def _changed(self, filepath):
+        # a write usually produces a burst of events; only run the callback
+        # once per reactor iteration for each file
+        if not self.dirty:
+            reactor.callLater(0, self._flush)
+        self.dirty.add(filepath)
+
+    def _flush(self):
+        dirty, self.dirty = self.dirty, set()
+        for filepath in dirty:
+            old = self.stats[filepath]
+            self.stats[filepath] = new = self._stat(filepath)
+            if self.notifier and (filepath not in self.watched
+                                  or (old and new and old[0] != new[0])):
+                # replaced: watch the new file now rather than at the next
+                # sweep, so its writes aren't left to the sweep as well
+                self._rewatch(filepath)
+            try:
+                self.callback(filepath)
+            except Exception as e:
+                tlog(f"Error processing {filepath.path}: {e}")
+
+    def sweep(self):
+        for filepath, old in self.stats.items():
+            self._watch(filepath)
+            if self._stat(filepath) != old:
+                self._changed(filepath)
+
+class InProgressIndex:
+    """Who is playing what, from the inprogress and whereis directories.
+
+    The directories themselves are discovered by matching the entries of
+    DGLD and FILEROOT against per-variant patterns, so a new version of a
+    variant is picked up without a code change and versions that were
+    never installed cost nothing. Discovery runs at startup, whenever
+    inotify reports an entry created, deleted or renamed in DGLD or
+    FILEROOT, and with every sweep.
+
+    Each directory listing is cached and indexed by lowercased player name,
+    so !players and !whereis don't touch the disk. A directory is re-read
+    when inotify says an entry was created, deleted or renamed in it, with
+    a sweep of every directory each LOG_SWEEP_INTERVAL seconds as backup.
+    Without inotify, lookups re-read everything at most every
+    LOG_CHECK_INTERVAL seconds.
+    """
+    if inotify:
+        watchMask = (inotify.IN_CREATE | inotify.IN_DELETE
+                     | inotify.IN_MOVED_FROM | inotify.IN_MOVED_TO)
+
+    def __init__(self, dgld, inprogPatterns, fileroot, whereisPatterns):
+        self.dgld = dgld
+        self.fileroot = fileroot
+        self.inprogPatterns = {var: re.compile(p) for var, p in inprogPatterns.items()}
+        self.whereisPatterns = {var: (re.compile(p), subdirs)
+                                for var, (p, subdirs) in whereisPatterns.items()}
+        self.inprog = {}        # variant -> inprogress directories found
+        self.whereis = {}       # variant -> whereis directories found
+        self.ttyrecs = {}       # inprogress dir -> {lname: [ttyrec filenames]}
+        self.wherefiles = {}    # whereis dir -> {lname: [whereis filenames]}
+        self.playing = {}       # lname -> {variant: games in progress}
+        self.dirvar = {}        # inprogress dir -> variant
+        self.dirs = {}          # inotify reports bytes-mode paths; map them back
+        self.roots = {}         # same, for DGLD and FILEROOT
+        self.dirty = set()
+        self.rediscover = False
+        self.notifier = None
+        self.sweeper = None
+        self.swept = 0
+
+    def start(self):
+        if inotify:
+            try:
+                self.notifier = inotify.INotify()
+                self.notifier.startReading()
+            except Exception as e:
+                tlog(f"inotify unavailable, scanning game directories on demand: {e}")
+                self.notifier = None
+        self.sweep()
+        tlog(f"Found {sum(map(len, self.inprog.values()))} inprogress and "
+             f"{sum(map(len, self.whereis.values()))} whereis directories")
+        if self.notifier:
+            self.sweeper = task.LoopingCall(self.sweep)
+            self.sweeper.start(LOG_SWEEP_INTERVAL, now=False)
+
+    def stop(self):
+        if self.sweeper and self.sweeper.running:
+            self.sweeper.stop()
+        if self.notifier:
+            self.notifier.loseConnection()
+            self.notifier = None
+
+    def allDirs(self):
+        for var in self.inprog:
+            yield from self.inprog[var]
+        for var in self.whereis:
+            yield from self.whereis[var]
+
+    @staticmethod
+    def _listdir(d):
+        # version numbers sort numerically, so nh370.9 comes before nh370.10
+        try:
+            names = os.listdir(d)
+        except OSError:
+            return []
+        return sorted(names, key=lambda name: [int(s) if s.isdigit() else s
+                                               for s in re.split(r"(\d+)", name)])
+
+    def discover(self):
+        """Match the entries of DGLD and FILEROOT against the variant patterns"""
+        self._watchRoot(self.dgld)
+        self._watchRoot(self.fileroot)
+        inprog = {}
+        for name in self._listdir(self.dgld):
+            if not name.startswith("inprogress-"): continue
+            for var, pattern in self.inprogPatterns.items():
+                if pattern.fullmatch(name[len("inprogress-"):]):
+                    inprog.setdefault(var, []).append(self.dgld + name + "/")
+                    break
+        whereis = {}
+        for name in self._listdir(self.fileroot):
+            for var, (pattern, subdirs) in self.whereisPatterns.items():
+                if pattern.fullmatch(name):
+                    for sub in subdirs:
+                        d = self.fileroot + name + "/" + sub
+                        if os.path.isdir(d):
+                            whereis.setdefault(var, []).append(d)
+                    break
+        # keep the variant order of the pattern tables, and forget
+        # directories that went away
+        dirvar = self.dirvar
+        self.inprog = {var: inprog[var] for var in self.inprogPatterns if var in inprog}
+        self.whereis = {var: whereis[var] for var in self.whereisPatterns if var in whereis}
+        self.dirvar = {d: var for var in self.inprog for d in self.inprog[var]}
+        for d in [d for d in self.ttyrecs if dirvar.get(d) != self.dirvar.get(d)]:
+            self._count(dirvar[d], self.ttyrecs.pop(d), -1)
+        live = set(self.allDirs())
+        for d in [d for d in self.wherefiles if d not in live]:
+            del self.wherefiles[d]
+        for dirpath in [p for p, d in self.dirs.items() if d not in live]:
+            del self.dirs[dirpath]
+
+    def _watchRoot(self, d):
+        dirpath = filepath.FilePath(d).asBytesMode()
+        if not self.notifier or dirpath in self.roots: return
+        try:
+            self.notifier.watch(dirpath, mask=self.watchMask, callbacks=[self._notified])
+            self.roots[dirpath] = d
+        except Exception:
+            pass # the sweep will try again
+
+    def _watch(self, d):
+        dirpath = filepath.FilePath(d).asBytesMode()
+        if not self.notifier or dirpath in self.dirs: return
+        try:
+            self.notifier.watch(dirpath, mask=self.watchMask, callbacks=[self._notified])
+            self.dirs[dirpath] = d
+        except Exception:
+            pass # not there (yet); the sweep will try again
+
+    def _notified(self, ignored, path, mask):
+        parent = path.parent()
+        if parent in self.roots:
+            d = None
+        else:
+            d = self.dirs.get(parent)
+            if d is None: return
+        # coalesce a burst of events into one re-read per directory
+        if not self.dirty and not self.rediscover:
+            reactor.callLater(0, self._flush)
+        if d is None:
+            self.rediscover = True
+        else:
+            self.dirty.add(d)
+
+    def _flush(self):
+        dirty, self.dirty = self.dirty, set()
+        if self.rediscover:
+            self.rediscover = False
+            before = set(self.allDirs())
+            self.discover()
+            for d in self.allDirs():
+                if d not in before:
+                    self._watch(d)
+                    dirty.add(d)
+        live = set(self.allDirs())
+        for d in dirty:
+            if d in live: self._scan(d)
+
+    def sweep(self):
+        self.discover()
+        for d in self.allDirs():
+            self._watch(d)
+            self._scan(d)
+        self.swept = time.time()
+
+    def _fresh(self):
+        # with inotify the index is always current
+        if not self.notifier and time.time() > self.swept + LOG_CHECK_INTERVAL:
+            self.sweep()
+
+    def _count(self, var, ttyrecs, sign):
+        for lname, files in ttyrecs.items():
+            games = self.playing.setdefault(lname, {})
+            games[var] = games.get(var, 0) + sign * len(files)
+            if not games[var]: del games[var]
+            if not games: del self.playing[lname]
+
+    def _scan(self, d):
+        try:
+            with os.scandir(d) as it:
+                names = [entry.name for entry in it]
+        except OSError:
+            names = []
+        if d in self.dirvar:
+            var = self.dirvar[d]
+            self._count(var, self.ttyrecs.get(d, {}), -1)
+            ttyrecs = {}
+            for name in names:
+                if name.endswith(".ttyrec"):
+                    # PLAYER:shit:garbage.ttyrec
+                    ttyrecs.setdefault(name.split(":")[0].lower(), []).append(name)
+            self._count(var, ttyrecs, 1)
+            self.ttyrecs[d] = ttyrecs
+        else:
+            wherefiles = {}
+            for name in names:
+                if name.endswith(".whereis"):
+                    wherefiles.setdefault(name[:-len(".whereis")].lower(), []).append(name)
+            self.wherefiles[d] = wherefiles
+
+    def players(self):
+        """(player, variant) for every game in progress"""
+        self._fresh()
+        for var in self.inprog:
+            for d in self.inprog[var]:
+                for files in self.ttyrecs.get(d, {}).values():
+                    for name in files:
+                        yield (name.split(":")[0], var)
+
+    def variantsPlaying(self, player):
+        """Variants player has a game in progress in"""
+        self._fresh()
+        games = self.playing.get(player.lower(), {})
+        return [var for var in self.inprog if var in games]
+
+    def whereisFile(self, var, player):
+        """Path of player's whereis file for var (preferring the exact case), or None"""
+        self._fresh()
+        for d in self.whereis.get(var, []):
+            names = self.wherefiles.get(d, {}).get(player.lower())
+            if names:
+                exact = player + ".whereis"
+                return d + (exact if exact in names else names[0])
+        return None
+
+class LogTailer:
+    """Follow one log file, returning complete lines as they are appended.
+
+    The file stays open between reads. Each read checks the path's inode and
+    size: a new inode means the file was replaced (e.g. a variant upgrade
+    reset its xlogfile), so we finish the old file and start the new one from
+    the top; a size below our offset means it was truncated in place.
+    """
+    def __init__(self, filepath, offset=0):
+        self.filepath = filepath
+        self.offset = offset
+        self.handle = None
+        self.inode = None
+
+    def _open(self):
+        self.handle = open(self.filepath.path, "rb")
+        self.inode = os.fstat(self.handle.fileno()).st_ino
+
+    def close(self):
+        if self.handle is not None:
+            self.handle.close()
+            self.handle = None
+
+    def _read(self):
+        # only hand back whole lines; a partial one is left for next time
+        self.handle.seek(self.offset)
+        data = self.handle.read()
+        end = data.rfind(b"\n") + 1
+        self.offset += end
+        return data[:end].splitlines(keepends=True)
+
+    def readLines(self):
+        try:
+            st = os.stat(self.filepath.path)
+        except OSError:
+            return [] # gone for now - keep waiting for it to come back
+        lines = []
+        if self.handle is not None and st.st_ino != self.inode:
+            tlog(f"{self.filepath.path} was replaced, reopening")
+            lines = self._read()
+            self.close()
+            self.offset = 0
+        if self.handle is None:
+            try:
+                self._open()
+            except OSError as e:
+                tlog(f"Cannot open {self.filepath.path}: {e}")
+                return lines
+        elif st.st_size < self.offset:
+            tlog(f"{self.filepath.path} was truncated, reading from the start")
+            self.offset = 0
+        if st.st_size > self.offset:
+            lines += self._read()
+        return lines
+
+class AscStore:
+    """Game and ascension counts per variant, for !asc.
+
+    Players are interned once into a single lowercased-name -> id table
+    shared by every variant. Per variant, games played is an array indexed
+    by player id, and each player who has ascended gets an array of
+    counters indexed by role/race/gender/align column. That is a lot
+    smaller than a dict (or dict of dicts) per player per variant.
+    """
+    def __init__(self, variants):
+        self.players = {}                                 # lname -> player id
+        self.games = {v: array.array("I") for v in variants}  # [player id] -> games
+        self.columns = {v: {} for v in variants}          # role/race/etc -> column
+        self.counters = {v: {} for v in variants}         # player id -> array of counts
+
+    def __iter__(self):
+        return iter(self.games)
+
+    def size(self):
+        """Bytes held: the intern table and its names, then every variant's
+        games array and counter rows"""
+        size = sys.getsizeof(self.players)
+        size += sum(sys.getsizeof(lname) for lname in self.players)
+        for var, games in self.games.items():
+            size += games.itemsize * len(games)
+            size += sys.getsizeof(self.counters[var])
+            size += sum(row.itemsize * len(row) for row in self.counters[var].values())
+        return size
+
+    def _playerId(self, lname):
+        pid = self.players.get(lname)
+        if pid is None:
+            pid = self.players[lname] = len(self.players)
+        return pid
+
+    def addGame(self, var, lname, count = 1):
+        pid = self._playerId(lname)
+        games = self.games[var]
+        if pid >= len(games):
+            games.extend([0] * (pid + 1 - len(games)))
+        games[pid] += count
+
+    def addAscension(self, var, lname, keys, counts = None):
+        """Count an ascension as each of keys (role, race, gender, align),
+        or add the matching counts instead of 1 each if given"""
+        pid = self._playerId(lname)
+        columns = self.columns[var]
+        row = self.counters[var].get(pid)
+        if row is None:
+            row = self.counters[var][pid] = array.array("I")
+        for i, key in enumerate(keys):
+            col = columns.get(key)
+            if col is None:
+                col = columns[key] = len(columns)
+            if col >= len(row):
+                row.extend([0] * (col + 1 - len(row)))
+            row[col] += counts[i] if counts else 1
+
+    def gameCount(self, var, lname):
+        pid = self.players.get(lname)
+        if pid is None or pid >= len(self.games[var]):
+            return 0
+        return self.games[var][pid]
+
+    def hasAscended(self, var, lname):
+        return self.players.get(lname) in self.counters[var]
+
+    def ascCount(self, var, lname, key):
+        row = self.counters[var].get(self.players.get(lname))
+        col = self.columns[var].get(key)
+        if row is None or col is None or col >= len(row):
+            return 0
+        return row[col]
+
+    def replaceVariant(self, other, var):
+        """Take over var's counts from another store (see _mergeReplay)"""
+        self.games[var] = array.array("I")
+        self.counters[var] = {}
+        self.columns[var] = {}
+        keys = list(other.columns[var])
+        for lname, pid in other.players.items():
+            if pid < len(other.games[var]) and other.games[var][pid]:
+                self.addGame(var, lname, other.games[var][pid])
+            row = other.counters[var].get(pid)
+            if row is not None:
+                self.addAscension(var, lname, keys[:len(row)], row)
+
+class LastGameIndex:
+    """Most recent game (or ascension) for !lastgame and !lastasc.
+
+    Entries are (endtime, dumplog, variant, player) tuples, where dumplog
+    is only what DumplogTemplate.key() takes from the game (usually its
+    starttime); the path and URLs are built when asked for. They are kept for the
+    newest game overall, per lowercased player, per variant and per
+    (variant, lowercased player), so each kind of query is one lookup.
+    Per variant we assume the xlogfile is in order and just take the last
+    line; across variants we compare endtimes.
+    """
+    def __init__(self):
+        self.latest = None
+        self.byplayer = {}
+        self.byvariant = {}
+        self.byplayervariant = {}
+
+    def add(self, endtime, dumplog, variant, player):
+        entry = (endtime, dumplog, variant, player)
+        lname = player.lower()
+        self.byvariant[variant] = entry
+        self.byplayervariant[(variant, lname)] = entry
+        if endtime > self.byplayer.get(lname, (0,))[0]:
+            self.byplayer[lname] = entry
+        if endtime > (self.latest or (0,))[0]:
+            self.latest = entry
+
+    def forPlayer(self, lname):
+        return self.byplayer.get(lname)
+
+    def forVariant(self, variant):
+        return self.byvariant.get(variant)
+
+    def forPlayerVariant(self, variant, lname):
+        return self.byplayervariant.get((variant, lname))
+
+    def merge(self, other):
+        """Fold in another index covering a disjoint set of variants"""
+        self.byvariant.update(other.byvariant)
+        self.byplayervariant.update(other.byplayervariant)
+        for lname, entry in other.byplayer.items():
+            if entry[0] > self.byplayer.get(lname, (0,))[0]:
+                self.byplayer[lname] = entry
+        if other.latest and other.latest[0] > (self.latest or (0,))[0]:
+            self.latest = other.latest
+
+class DumplogTemplate:
+    """Where one xlogfile's games keep their dumplogs.
+
+    dumpfmt is the location under the player's userdata directory, as in
+    the xlogfiles table ("nethack/dumplog/{starttime}.nh.html"). It is
+    parsed once into a positional format, so each game costs one format()
+    call on just the fields it names, and locate() gives the path and both
+    URLs (see DumplogLocator) from that one result. The stats keep only
+    key(game), the values of those fields; locate() rebuilds the path and
+    URLs from it when one is handed out.
+    """
+    def __init__(self, dumpfmt, fileroot, urlroot, s3root):
+        self.fileroot = fileroot  # roots of the per-player directories
+        self.urlroot = urlroot
+        self.s3root = s3root      # None if this server doesn't archive to S3
+        self.fields = []
+        fmt = ""
+        for literal, field, spec, conversion in string.Formatter().parse(dumpfmt):
+            fmt += literal.replace("{", "{{").replace("}", "}}")
+            if field is None: continue
+            key = re.match(r"[^.[]*", field).group()
+            if key not in self.fields: self.fields.append(key)
+            fmt += "{" + str(self.fields.index(key)) + field[len(key):]
+            if conversion: fmt += "!" + conversion
+            if spec: fmt += ":" + spec
+            fmt += "}"
+        self.fmt = fmt
+
+    def key(self, game):
+        """The fields of game that locate() needs: the value itself for the
+        usual single field, else a tuple"""
+        if len(self.fields) == 1:
+            return game[self.fields[0]]
+        return tuple(game[key] for key in self.fields)
+
+    def locate(self, name, key):
+        """(dumpfile, url, s3url) for the dumplog of name's game with key"""
+        userdir = f"{name[0]}/{name}/"
+        values = (key,) if len(self.fields) == 1 else key
+        path = self.fmt.format(*values)
+        quoted = urllib.parse.quote(path)
+        s3url = None
+        if self.s3root:
+            s3url = self.s3root + userdir + quoted
+        return (self.fileroot + userdir + path, self.urlroot + userdir + quoted, s3url)
+
+class DumplogLocator:
+    """Which URL a dumplog can be read at: ours, or S3 once it's archived.
+
+    Each variant's DumplogTemplate gives a dumplog's path on local storage,
+    its URL on our web server and its S3 URL (None if this server doesn't
+    archive to S3). Choosing between them takes a stat of the path, so the
+    xlogfile replay at startup only records the template's key and the
+    check is made when the URL is first handed out. Results, found or not,
+    are cached for DUMPLOG_CACHE_TTL seconds.
+    """
+    def __init__(self):
+        self.templates = {} # variant -> DumplogTemplate
+        self.checked = {}   # dumpfile -> (when checked, exists)
+
+    def url(self, variant, name, dumplog):
+        """URL for name's variant dumplog with template key dumplog, or
+        None if there's nowhere to read it"""
+        template = self.templates.get(variant)
+        if template is None: return None
+        (dumpfile, url, s3url) = template.locate(name, dumplog)
+        if TEST or self.exists(dumpfile):
+            return url
+        return s3url
+
+    def exists(self, dumpfile):
+        now = time.time()
+        checked = self.checked.get(dumpfile)
+        if checked and now < checked[0] + DUMPLOG_CACHE_TTL:
+            return checked[1]
+        if len(self.checked) >= DUMPLOG_CACHE_MAX:
+            self.checked = {f: c for f, c in self.checked.items()
+                            if now < c[0] + DUMPLOG_CACHE_TTL}
+            if len(self.checked) >= DUMPLOG_CACHE_MAX: self.checked.clear()
+        exists = os.path.exists(dumpfile)
+        self.checked[dumpfile] = (now, exists)
+        return exists
+
+class PerfStats:
+    """Rolling timings for whatever might be holding up the reactor.
+
+    Durations are recorded per category (lag, cmd, log, query) for
+    percentiles, and every operation is also kept with a label in one
+    recent list, so !slow can say exactly what was slow.
+    """
+    def __init__(self):
+        self.samples = {}  # category -> recent durations
+        self.recent = collections.deque(maxlen=PERF_SAMPLES)
+        self.lastTick = None
+
+    def record(self, category, label, seconds):
+        samples = self.samples.get(category)
+        if samples is None:
+            samples = self.samples[category] = collections.deque(maxlen=PERF_SAMPLES)
+        samples.append(seconds)
+        self.recent.append((seconds, category, label, time.time()))
+
+    def percentile(self, category, pct):
+        samples = sorted(self.samples.get(category, ()))
+        if not samples: return None
+        return samples[min(len(samples) - 1, len(samples) * pct // 100)]
+
+    def slowest(self, count):
+        return heapq.nlargest(count, self.recent)
+
+    def tick(self):
+        # LoopingCall: anything past the interval is time the reactor was busy
+        now = time.monotonic()
+        if self.lastTick is not None:
+            self.record("lag", "reactor", max(0.0, now - self.lastTick - PERF_LAG_INTERVAL))
+        self.lastTick = now
+
+class HttpFetcher:
+    """Blocking requests.get calls, run on a small thread pool.
+
+    get() returns a Deferred firing with the requests Response (or failing
+    with the requests exception) back on the reactor thread. Concurrent
+    gets for the same URL share one fetch.
+    """
+    def __init__(self):
+        self.pool = ThreadPool(0, HTTP_THREADS, name="http")
+        self.inflight = {}  # url -> Deferreds waiting for it
+
+    def get(self, url, headers=None):
+        if not self.pool.started:
+            self.pool.start()
+        d = defer.Deferred()
+        if url in self.inflight:
+            self.inflight[url].append(d)
+            return d
+        self.inflight[url] = [d]
+        fetch = threads.deferToThreadPool(reactor, self.pool, requests.get, url,
+                                          headers=headers, timeout=HTTP_TIMEOUT)
+        fetch.addBoth(self._fetched, url)
+        return d
+
+    def _fetched(self, result, url):
+        for d in self.inflight.pop(url):
+            if isinstance(result, failure.Failure):
+                d.errback(result)
+            else:
+                d.callback(result)
+
+    def stop(self):
+        if self.pool.started:
+            self.pool.stop()
+
+class RumorCorpus:
+    """One rumors file, indexed for case-insensitive substring search.
+
+    Keeps the lowercased lines and a trigram -> line numbers index, so a
+    search only has to check lines containing every trigram of the match.
+    """
+    def __init__(self, rumors):
+        self.rumors = rumors
+        self.lower = [r.lower() for r in rumors]
+        self.trigrams = {}
+        for i, line in enumerate(self.lower):
+            for tri in {line[j:j+3] for j in range(len(line) - 2)}:
+                self.trigrams.setdefault(tri, []).append(i)
+
+    def __len__(self):
+        return len(self.rumors)
+
+    def search(self, match):
+        """Rumors containing match, ignoring case"""
+        match = match.lower()
+        if len(match) < 3:
+            candidates = range(len(self.lower))
+        else:
+            postings = []
+            for tri in {match[j:j+3] for j in range(len(match) - 2)}:
+                if tri not in self.trigrams: return []
+                postings.append(self.trigrams[tri])
+            postings.sort(key=len)
+            candidates = set(postings[0]).intersection(*postings[1:])
+        return [self.rumors[i] for i in sorted(candidates) if match in self.lower[i]]
+
+class RumorCache:
+    """Rumors files, kept in a shelve under BOTDIR so they survive restarts.
+
+    Entries are url -> (last checked, ETag, Last-Modified, rumors). Once an
+    entry is older than RUMOR_CACHE_TTL it is still served straight away,
+    and a conditional GET in the background picks up any newer copy. Only
+    a URL we have never seen waits on the network. If revalidation fails,
+    the old copy is tried again after RUMOR_RETRY_INTERVAL rather than on
+    every !rumor. Rumors are handed out as
+    a RumorCorpus, built once per version of the file.
+    """
+    def __init__(self, http, db):
+        self.http = http
+        self.db = db
+        self.entries = {} # in-memory copy of what we've read from db
+        self.corpora = {} # url -> RumorCorpus of entries[url]
+
+    def get(self, url):
+        """Deferred firing with the RumorCorpus for url, False if we can't get it"""
+        d = self._get(url)
+        d.addCallback(self._corpus, url)
+        return d
+
+    def _corpus(self, rumors, url):
+        if rumors is False: return False
+        corpus = self.corpora.get(url)
+        if corpus is None or corpus.rumors is not rumors:
+            corpus = self.corpora[url] = RumorCorpus(rumors)
+        return corpus
+
+    def _get(self, url):
+        entry = self.entries.get(url)
+        if entry is None and url in self.db:
+            entry = self.entries[url] = self.db[url]
+        if entry is None:
+            tlog(f"url {url} not found in rumor cache, downloading...")
+            return self._fetch(url, None)
+        now = time.time()
+        if now > entry[0] + RUMOR_CACHE_TTL:
+            # serve the old copy meanwhile; until the fetch succeeds, it
+            # counts as checked RUMOR_RETRY_INTERVAL before it goes stale
+            self.entries[url] = (now - RUMOR_CACHE_TTL + RUMOR_RETRY_INTERVAL,) + entry[1:]
+            self._fetch(url, entry)
+        return defer.succeed(entry[3])
+
+    def _fetch(self, url, entry):
+        headers = {}
+        if entry and entry[1]: headers["If-None-Match"] = entry[1]
+        if entry and entry[2]: headers["If-Modified-Since"] = entry[2]
+        d = self.http.get(url, headers=headers)
+        d.addCallbacks(self._fetched, self._fetchFailed,
+                       callbackArgs=(url, entry), errbackArgs=(url, entry))
+        return d
+
+    def _fetched(self, r, url, entry):
+        if entry and r.status_code == 304: # not modified
+            entry = (time.time(),) + entry[1:]
+        elif r.status_code != requests.codes.ok:
+            tlog(f"Failed to fetch {url}: HTTP {r.status_code}")
+            return entry[3] if entry else False
+        else:
+            # filter out comments (# at start of line) and blanks, no point saving them
+            rumors = [r for r in filter(lambda r : len(r) > 0 and r[0] != '#', r.text.splitlines())]
+            entry = (time.time(), r.headers.get("ETag"), r.headers.get("Last-Modified"), rumors)
+        self.entries[url] = self.db[url] = entry
+        self.db.sync()
+        return entry[3]
+
+    def _fetchFailed(self, f, url, entry):
+        if f.check(requests.exceptions.Timeout):
+            tlog(f"Timeout fetching {url}")
+        elif f.check(requests.exceptions.ConnectionError):
+            tlog(f"Connection error fetching {url}: {f.value}")
+        else:
+            tlog(f"Error fetching {url}: {f.value}")
+        return entry[3] if entry else False
+
+class TellStore:
+    """Undelivered !tell messages, in an SQLite database under BOTDIR.
+
+    One row per message, indexed by (lowercased) recipient and by time, so
+    delivery, expiry and the MAX_TELLBUF_MESSAGES quota are each a single
+    indexed query. The number of messages, and the set of recipients with
+    messages waiting, are kept in memory, so checking whether someone who
+    just spoke has messages doesn't touch the disk. Messages from the old
+    shelve are imported the first time the database is created.
+    """
+    def __init__(self, path, legacy=()):
+        self.db = sqlite3.connect(path)
+        self.db.execute("PRAGMA journal_mode=WAL")
+        self.db.execute("PRAGMA synchronous=NORMAL")
+        new = self.db.execute("PRAGMA user_version").fetchone()[0] == 0
+        with self.db:
+            self.db.execute("CREATE TABLE IF NOT EXISTS messages (id INTEGER PRIMARY KEY, "
+                            "recipient TEXT NOT NULL, forwardto TEXT NOT NULL, "
+                            "sender TEXT NOT NULL, ts REAL NOT NULL, message TEXT NOT NULL)")
+            self.db.execute("CREATE INDEX IF NOT EXISTS messages_recipient ON messages (recipient)")
+            self.db.execute("CREATE INDEX IF NOT EXISTS messages_ts ON messages (ts)")
+            if new:
+                self._migrate(legacy)
+                self.db.execute("PRAGMA user_version=1")
+        self.count = self.db.execute("SELECT COUNT(*) FROM messages").fetchone()[0]
+        self._loadRecipients()
+
+    def _loadRecipients(self):
+        self.recipients = {row[0] for row in
+                           self.db.execute("SELECT DISTINCT recipient FROM messages")}
+
+    def _migrate(self, legacy):
+        for path in legacy:
+            try:
+                old = shelve.open(path, flag="r")
+            except Exception:
+                continue
+            rows = [(recipient,) + tuple(msg) for recipient in old for msg in old[recipient]]
+            old.close()
+            self.db.executemany("INSERT INTO messages (recipient, forwardto, sender, ts, message) "
+                                "VALUES (?, ?, ?, ?, ?)", rows)
+            tlog(f"Imported {len(rows)} !tell messages from {path}")
+            return
+
+    def __len__(self):
+        return self.count
+
+    def add(self, recipient, forwardto, sender, ts, message):
+        """Store a message; False if we're already holding MAX_TELLBUF_MESSAGES"""
+        if self.count >= MAX_TELLBUF_MESSAGES:
+            return False
+        with self.db:
+            self.db.execute("INSERT INTO messages (recipient, forwardto, sender, ts, message) "
+                            "VALUES (?, ?, ?, ?, ?)", (recipient, forwardto, sender, ts, message))
+        self.count += 1
+        self.recipients.add(recipient)
+        return True
+
+    def has(self, recipient):
+        return recipient in self.recipients
+
+    def take(self, recipient):
+        """Remove and return recipient's messages, oldest first,
+        as (forwardto, sender, timestamp, message)"""
+        with self.db:
+            messages = self.db.execute("SELECT forwardto, sender, ts, message FROM messages "
+                                       "WHERE recipient = ? ORDER BY id", (recipient,)).fetchall()
+            self.db.execute("DELETE FROM messages WHERE recipient = ?", (recipient,))
+        self.count -= len(messages)
+        self.recipients.discard(recipient)
+        return messages
+
+    def expire(self, before):
+        """Drop messages left before the given time; returns how many"""
+        with self.db:
+            removed = self.db.execute("DELETE FROM messages WHERE ts < ?", (before,)).rowcount
+        self.count -= removed
+        if removed: self._loadRecipients()
+        return removed
+
+    def close(self):
+        self.db.close()
+
+class ChannelLog:
+    """The channel's daily log file, LOGROOT/<channel>-YYYY-MM-DD.log.
+
+    Lines are buffered and written out CHANLOG_FLUSH_INTERVAL seconds after
+    the first one, or as soon as CHANLOG_BUFFER_MAX characters are waiting.
+    The "HH:MM " prefix is formatted once a minute, and the next midnight
+    is kept as a timestamp so the rotation check is one comparison.
+    """
+    def __init__(self, prefix):
+        self.prefix = prefix    # path up to the date
+        self.buffer = []
+        self.buffered = 0       # characters in buffer
+        self.timer = None
+        self.minute = None      # minute (since the epoch) of self.stamp
+        self.stamp = ""
+        self._open()
+
+    def _open(self):
+        today = datetime.date.today()
+        self.name = self.prefix + today.strftime("-%Y-%m-%d.log")
+        self.file = open(self.name, 'a')
+        os.chmod(self.name, stat.S_IRUSR|stat.S_IWUSR|stat.S_IRGRP|stat.S_IROTH)
+        self.midnight = time.mktime((today + datetime.timedelta(days=1)).timetuple())
+
+    def write(self, message):
+        now = time.time()
+        if now >= self.midnight:
+            self.flush()
+            self.file.close()
+            self._open()
+        if int(now // 60) != self.minute:
+            self.minute = int(now // 60)
+            self.stamp = time.strftime("%H:%M ", time.localtime(now))
+        line = self.stamp + message + "\n"
+        self.buffer.append(line)
+        self.buffered += len(line)
+        if self.buffered >= CHANLOG_BUFFER_MAX:
+            self.flush()
+        elif not self.timer:
+            self.timer = reactor.callLater(CHANLOG_FLUSH_INTERVAL, self.flush)
+
+    def flush(self):
+        if self.timer and self.timer.active():
+            self.timer.cancel()
+        self.timer = None
+        if not self.buffer: return
+        self.file.write("".join(self.buffer))
+        self.file.flush()
+        self.buffer = []
+        self.buffered = 0
+
+class OutboundQueue:
+    """Messages waiting to go to the IRC server, paced to stay under its
+    flood limit (getting killed for excess flood costs a reconnect).
+
+    A token bucket allows bursts of OUTBOUND_BURST lines and refills at
+    OUTBOUND_RATE lines per second; with no rate set, lines go straight out
+    as they always did. When the bucket runs dry, lines queue up and go
+    out by priority (CONTROL - NickServ and master/slave queries - then
+    ANNOUNCE, REPLY and FORWARD), oldest first within each. An announcement
+    or forwarded line identical to one still waiting is dropped; replies
+    never are, since two users can ask the same thing. Lines can carry
+    their origin, e.g. the (line, variant) of a game announcement, so what
+    didn't get sent can be made again later.
+    """
+    CONTROL, ANNOUNCE, REPLY, FORWARD = range(4)
+    COALESCE = (ANNOUNCE, FORWARD)
+
+    def __init__(self, send, rate, burst, clock=reactor):
+        self.send = send        # sends one line to the server
+        self.rate = rate
+        self.burst = burst
+        self.clock = clock      # for seconds() and callLater()
+        self.tokens = burst
+        self.stamp = clock.seconds()
+        self.queues = [collections.deque() for _ in range(self.FORWARD + 1)]
+        self.waiting = set()    # queued COALESCE lines, to spot duplicates
+        self.coalesced = 0      # duplicates dropped
+        self.timer = None
+
+    def __len__(self):
+        return sum(len(q) for q in self.queues)
+
+    def put(self, line, priority, origin=None):
+        if not self.rate:
+            self.send(line)
+            return
+        if priority in self.COALESCE:
+            if line in self.waiting:
+                self.coalesced += 1
+                return
+            self.waiting.add(line)
+        self.queues[priority].append((line, origin))
+        self._drain()
+
+    def _drain(self):
+        now = self.clock.seconds()
+        self.tokens = min(self.burst, self.tokens + max(0, now - self.stamp) * self.rate)
+        self.stamp = now
+        while self.tokens >= 1 and any(self.queues):
+            (line, origin) = next(q for q in self.queues if q).popleft()
+            self.waiting.discard(line)
+            self.tokens -= 1
+            self.send(line)
+        if any(self.queues) and not (self.timer and self.timer.active()):
+            self.timer = self.clock.callLater((1 - self.tokens) / self.rate, self._drain)
+
+    def clear(self):
+        """Forget everything still waiting. Returns the origins of unsent
+        announcements, in order, and how many other lines were dropped."""
+        if self.timer and self.timer.active():
+            self.timer.cancel()
+        origins = []
+        dropped = 0
+        for priority, q in enumerate(self.queues):
+            for (line, origin) in q:
+                if priority == self.ANNOUNCE and origin is not None:
+                    if origin not in origins: origins.append(origin)
+                else:
+                    dropped += 1
+        for q in self.queues:
+            q.clear()
+        self.waiting.clear()
+        return (origins, dropped)
+
+class HostThrottle:
+    """Recent command history for one user@host (see RateLimiter).
+
+    Each window keeps only as many timestamps as its limit, in a deque, so
+    "limit reached" is just "full, and the oldest is inside the window".
+    """
+    __slots__ = ("commands", "recent", "responses", "last_command", "expires")
+
+    def __init__(self):
+        self.commands = collections.deque(maxlen=RATE_LIMIT_COMMANDS)  # RATE_LIMIT_WINDOW
+        self.recent = collections.deque(maxlen=ABUSE_THRESHOLD)        # ABUSE_WINDOW
+        self.responses = collections.deque(maxlen=RESPONSE_RATE_LIMIT) # RESPONSE_RATE_WINDOW
+        self.last_command = None
+        self.expires = 0
+
+def window_full(stamps, now, window):
+    """True if stamps (a deque capped at the limit) holds limit times within window"""
+    return len(stamps) == stamps.maxlen and now - stamps[0] < window
+
+class RateLimiter:
+    """Per-host rate limiting, burst protection and abuse penalties.
+
+    Each check is O(1). Hosts are kept in least recently active order, and
+    whenever we look at one, records at the old end that have outlived every
+    window are dropped, so memory follows recent activity. It is also capped
+    at RATE_LIMIT_HOSTS records; past that the least recently active host is
+    forgotten, so a flood of distinct hosts can't run us out of memory.
+
+    Abuse penalties are kept apart, in a dict of the few hosts serving one,
+    so neither expiry nor eviction of a host's record lets it off early.
+    """
+    keep = max(RATE_LIMIT_WINDOW, BURST_WINDOW, ABUSE_WINDOW, RESPONSE_RATE_WINDOW)
+
+    def __init__(self, capacity=RATE_LIMIT_HOSTS, clock=time.time):
+        self.clock = clock
+        self.hosts = collections.OrderedDict() # host -> HostThrottle
+        self.penalties = {}                    # host -> end of abuse penalty
+        self.capacity = capacity
+        self.expired = 0  # records dropped after outliving their windows
+        self.evicted = 0  # records dropped for space
+
+    def __len__(self):
+        return len(self.hosts)
+
+    def _throttle(self, host, now):
+        while self.hosts:
+            oldest = next(iter(self.hosts.values()))
+            if oldest.expires > now: break
+            self.hosts.popitem(last=False)
+            self.expired += 1
+        throttle = self.hosts.get(host)
+        if throttle is None:
+            if len(self.hosts) >= self.capacity:
+                self.hosts.popitem(last=False)
+                self.evicted += 1
+            throttle = self.hosts[host] = HostThrottle()
+        else:
+            self.hosts.move_to_end(host)
+        throttle.expires = now + self.keep
+        return throttle
+
+    def _penalty(self, host, now):
+        """When host's abuse penalty ends, or None if it has none"""
+        until = self.penalties.get(host)
+        if until is not None and until <= now:
+            del self.penalties[host]
+            until = None
+        return until
+
+    def allowBurst(self, host):
+        """False if host's last command was under BURST_WINDOW ago"""
+        now = self.clock()
+        throttle = self._throttle(host, now)
+        if throttle.last_command is not None and now - throttle.last_command < BURST_WINDOW:
+            return False
+        throttle.last_command = now
+        return True
+
+    def allowCommand(self, host):
+        """False if host is over RATE_LIMIT_COMMANDS or under an abuse penalty.
+        ABUSE_THRESHOLD commands within ABUSE_WINDOW earn an ABUSE_PENALTY."""
+        now = self.clock()
+        throttle = self._throttle(host, now)
+        if self._penalty(host, now):
+            return False
+        if window_full(throttle.commands, now, RATE_LIMIT_WINDOW):
+            return False
+        throttle.commands.append(now)
+        throttle.recent.append(now)
+        if window_full(throttle.recent, now, ABUSE_WINDOW):
+            # forget penalties that have run out while we're at it
+            self.penalties = {h: until for h, until in self.penalties.items()
+                              if until > now}
+            self.penalties[host] = now + ABUSE_PENALTY
+            throttle.recent.clear()
+            return False
+        return True
+
+    def allowPenaltyMessage(self, host):
+        """False if we've told host about a penalty RESPONSE_RATE_LIMIT
+        times in the last RESPONSE_RATE_WINDOW"""
+        now = self.clock()
+        throttle = self._throttle(host, now)
+        if window_full(throttle.responses, now, RESPONSE_RATE_WINDOW):
+            return False
+        throttle.responses.append(now)
+        return True
+
+    def penaltyRemaining(self, host):
+        """Seconds left on host's abuse penalty, or None"""
+        now = self.clock()
+        until = self._penalty(host, now)
+        if until is None: return None
+        return until - now
+
+    def penalized(self):
+        now = self.clock()
+        return sum(1 for until in self.penalties.values() if until > now)
+
 class DeathBotProtocol(irc.IRCClient):
     nickname = NICK
     username = USERNAME
@@ -198,9 +1455,6 @@ class DeathBotProtocol(irc.IRCClient):
     versionName = "beholder.py"
     versionNum = "0.1"
 
-    dump_url_prefix = WEBROOT + "userdata/{name[0]}/{name}/"
-    dump_file_prefix = FILEROOT + "dgldir/userdata/{name[0]}/{name}/"
-
     if not SLAVE:
         scoresURL = "https://nethackscoreboard.org (ALL)"
         ttyrecURL = WEBROOT + "nethack/ttyrecs"
@@ -208,10 +1462,7 @@ class DeathBotProtocol(irc.IRCClient):
         irclogURL = WEBROOT + "nethack/irclogs/hardfought"
         rceditURL = WEBROOT + "nethack/rcedit"
         helpURL = WEBROOT + "nethack"
-        logday = time.strftime("%d")
-        chanLogName = LOGROOT + CHANNEL + time.strftime("-%Y-%m-%d.log")
-        chanLog = open(chanLogName,'a')
-        os.chmod(chanLogName,stat.S_IRUSR|stat.S_IWUSR|stat.S_IRGRP|stat.S_IROTH)
+        chanLog = ChannelLog(LOGROOT + CHANNEL)
 
     xlogfiles = {filepath.FilePath(FILEROOT+"nh343-hdf/var/xlogfile"): ("nh343", ":", "nh343/dumplog/{starttime}.nh343.txt"),
                  filepath.FilePath(FILEROOT+"nh363-hdf/var/xlogfile"): ("nh363", "\t", "nethack/dumplog/{starttime}.nh.html"),
@@ -329,343 +1580,84 @@ class DeathBotProtocol(irc.IRCClient):
 
     # Override Twisted's msg() to disable automatic line splitting
     # We handle splitting ourselves in splitMessage() to preserve semantic boundaries
-    def msg(self, user, message, length=None):
+    def msg(self, user, message, length=None, priority=OutboundQueue.REPLY, origin=None):
         """Send a message to a user or channel, without Twisted's auto-splitting"""
-        # Use sendLine to send raw IRC PRIVMSG without length-based splitting
+        # master/slave queries and responses must beat QUERY_TIMEOUT,
+        # so they go ahead of any backlog of announcements
+        if message.startswith(("#Q# ", "#R# ")):
+            priority = OutboundQueue.CONTROL
+        # Queue a raw IRC PRIVMSG without length-based splitting
         # Format: PRIVMSG <target> :<message>
-        self.sendLine(f"PRIVMSG {user} :{message}")
+        self.outq.put(f"PRIVMSG {user} :{message}", priority, origin)
 
     # put the displaystring for a thing in square brackets
     def displaytag(self, thing):
        return '[' + self.displaystring.get(thing,thing) + ']'
 
     # for !who or !players or whatever we end up calling it
-    # Reduce the repetitive crap
+    # Every version of a variant gets its own inprogress and whereis
+    # directories, so rather than list them all we match what is on disk
+    # (see InProgressIndex.discover).
     DGLD=FILEROOT+"dgldir/"
-    INPR=DGLD+"inprogress-"
-    inprog = { "nh343" : [INPR+"nh343-hdf/"],
-               "nh363" : [INPR+"nh363-hdf/"],
-               "nh370" : [INPR+"nh370.16-hdf/", INPR+"nh370.17-hdf/",
-                          INPR+"nh370.18-hdf/", INPR+"nh370.20-hdf/",
-                          INPR+"nh370.22-hdf/", INPR+"nh370.23-hdf/",
-                          INPR+"nh370.27-hdf/", INPR+"nh370.28-hdf/",
-                          INPR+"nh370.29-hdf/", INPR+"nh370.30-hdf/",
-                          INPR+"nh370.31-hdf/", INPR+"nh370.32-hdf/",
-                          INPR+"nh370.35-hdf/", INPR+"nh370.36-hdf/",
-                          INPR+"nh370.38-hdf/", INPR+"nh370.39-hdf/",
-                          INPR+"nh370.40-hdf/", INPR+"nh370.42-hdf/",
-                          INPR+"nh370.43-hdf/", INPR+"nh370.46-hdf/",
-                          INPR+"nh370.47-hdf/", INPR+"nh370.50-hdf/",
-                          INPR+"nh370.51-hdf/", INPR+"nh370.53-hdf/",
-                          INPR+"nh370.58-hdf/", INPR+"nh370.59-hdf/",
-                          INPR+"nh370.60-hdf/", INPR+"nh370.61-hdf/",
-                          INPR+"nh370.62-hdf/", INPR+"nh370.64-hdf/",
-                          INPR+"nh370.65-hdf/", INPR+"nh370.66-hdf/",
-                          INPR+"nh370.69-hdf/", INPR+"nh370.70-hdf/",
-                          INPR+"nh370.71-hdf/", INPR+"nh370.73-hdf/",
-                          INPR+"nh370.78-hdf/", INPR+"nh370.80-hdf/",
-                          INPR+"nh370.82-hdf/", INPR+"nh370.83-hdf/",
-                          INPR+"nh370.84-hdf/", INPR+"nh370.86-hdf/",
-                          INPR+"nh370.87-hdf/", INPR+"nh370.88-hdf/",
-                          INPR+"nh370.89-hdf/", INPR+"nh370.90-hdf/",
-                          INPR+"nh370.94-hdf/", INPR+"nh370.95-hdf/",
-                          INPR+"nh370.97-hdf/", INPR+"nh370.101-hdf/",
-                          INPR+"nh370.102-hdf/", INPR+"nh370.103-hdf/",
-                          INPR+"nh370.105-hdf/", INPR+"nh370.106-hdf/",
-                          INPR+"nh370.107-hdf/", INPR+"nh370.110-hdf/",
-                          INPR+"nh370.112-hdf/", INPR+"nh370.114-hdf/",
-                          INPR+"nh370.115-hdf/", INPR+"nh370.119-hdf/",
-                          INPR+"nh370.120-hdf/", INPR+"nh370.123-hdf/",
-                          INPR+"nh370.124-hdf/", INPR+"nh370.127-hdf/",
-                          INPR+"nh370.128-hdf/", INPR+"nh370.130-hdf/",
-                          INPR+"nh370.132-hdf/", INPR+"nh370.134-hdf/",
-                          INPR+"nh370.137-hdf/"],
-               "nh500" : [INPR+"nh500.0-hdf/"],
-                "zapm" : [INPR+"zapm/"],
-                  "gh" : [INPR+"gh024/", INPR+"gh030/"],
-                  "un" : [INPR+"un531/", INPR+"un532/",
-                          INPR+"un600/", INPR+"un601/",
-                          INPR+"un602/", INPR+"un603/",
-                          INPR+"un604/", INPR+"un605/",
-                          INPR+"un606/", INPR+"un607/",
-                          INPR+"un608/", INPR+"un609/",
-                          INPR+"un6010/", INPR+"un6011/",
-                          INPR+"un6012/", INPR+"un6013/",
-                          INPR+"un6014/", INPR+"un6015/"],
-                 "dnh" : [INPR+"dnh3171/", INPR+"dnh318/",
-                          INPR+"dnh319/", INPR+"dnh3191/",
-                          INPR+"dnh320/", INPR+"dnh321/",
-                          INPR+"dnh3211/", INPR+"dnh3212/",
-                          INPR+"dnh3213/", INPR+"dnh3214/",
-                          INPR+"dnh322/", INPR+"dnh323/",
-                          INPR+"dnh324/", INPR+"dnh325/"],
-                  "fh" : [INPR+"fh/"],
-                  "4k" : [INPR+"4k/", INPR+"4k4305/"],
-                 "nh4" : [INPR+"nh4/"],
-                  "sp" : [INPR+"sp065/", INPR+"sp070/"],
-                 "xnh" : [INPR+"xnh040/", INPR+"xnh041/",
-                          INPR+"xnh50/", INPR+"xnh51/",
-                          INPR+"xnh51.1/", INPR+"xnh51.2/",
-                          INPR+"xnh51.3/", INPR+"xnh600/",
-                          INPR+"xnh610/", INPR+"xnh620/",
-                          INPR+"xnh630/", INPR+"xnh700/",
-                          INPR+"xnh7001/", INPR+"xnh710/",
-                          INPR+"xnh800/", INPR+"xnh8001/",
-                          INPR+"xnh900/", INPR+"xnh910/"],
-                 "spl" : [INPR+"spl063/", INPR+"spl064/",
-                          INPR+"spl070/", INPR+"spl071/",
-                          INPR+"spl071.21/", INPR+"spl080/",
-                          INPR+"spl081/", INPR+"spl082/",
-                          INPR+"spl100/", INPR+"spl110/",
-                          INPR+"spl120/"],
-               "nh13d" : [INPR+"nh13d/"],
-               "slshm" : [INPR+"slashem/"],
-                "ndnh" : [INPR+"ndnh-524/", INPR+"ndnh-1224/",
-                          INPR+"ndnh-0416/", INPR+"ndnh-0521/",
-                          INPR+"ndnh-0322/", INPR+"ndnh-0530/",
-                          INPR+"ndnh-0918/", INPR+"ndnh-0515/",
-                          INPR+"ndnh-0515v2/", INPR+"ndnh-0515v3/",
-                          INPR+"ndnh-0116/"],
-               "nndnh" : [INPR+"nndnh-0515/", INPR+"nndnh-0516/",
-                          INPR+"nndnh-0118/"],
-                "evil" : [INPR+"evil040/", INPR+"evil041/",
-                          INPR+"evil042/", INPR+"evil050/",
-                          INPR+"evil060/", INPR+"evil070/",
-                          INPR+"evil071/", INPR+"evil080/",
-                          INPR+"evil081/", INPR+"evil082/",
-                          INPR+"evil083/", INPR+"evil084/",
-                          INPR+"evil090/", INPR+"evil091/",
-                          INPR+"evil092/"],
-                "tnnt" : [INPR+"tnnt/"],
-              "nhthon" : [INPR+"nethackathon/"],
-                "slth" : [INPR+"slth095/", INPR+"slth096/",
-                          INPR+"slth097/"],
-               "gnoll" : [INPR+"gnoll4104/", INPR+"gnoll410b2/",
-                          INPR+"gnoll410b4/", INPR+"gnoll410b9/",
-                          INPR+"gnoll410b14/", INPR+"gnoll410b15/",
-                          INPR+"gnoll41041/", INPR+"gnoll410/",
-                          INPR+"gnoll411/", INPR+"gnoll4123/",
-                          INPR+"gnoll41316/", INPR+"gnoll41339/",
-                          INPR+"gnoll41350/", INPR+"gnoll41352/",
-                          INPR+"gnoll42016/", INPR+"gnoll42020/",
-                          INPR+"gnoll42041/", INPR+"gnoll42085/"],
-                 "ace" : [INPR+"ace/"],
-               "hackm" : [INPR+"hackem100/", INPR+"hackem110/",
-                          INPR+"hackem114/", INPR+"hackem120/",
-                          INPR+"hackem122/", INPR+"hackem130/",
-                          INPR+"hackem131/", INPR+"hackem132/"],
-                "nerf" : [INPR+"nerf200/", INPR+"nerf210/",
-                          INPR+"nerf221/"],
-                 "cre" : [INPR+"cre100/", INPR+"cre101/",
-                          INPR+"cre122/", INPR+"cre140/",
-                          INPR+"cre142/", INPR+"cre150/"],
-                 "dyn" : [INPR+"dyn/"]}
+    # variant -> pattern for DGLD/inprogress-<name>/
+    inprogPatterns = { "nh343" : r"nh343-hdf",
+                       "nh363" : r"nh363-hdf",
+                       "nh370" : r"nh370\.\d+-hdf",
+                       "nh500" : r"nh500\.\d+-hdf",
+                        "zapm" : r"zapm",
+                          "gh" : r"gh\d+",
+                          "un" : r"un\d+",
+                         "dnh" : r"dnh\d+",
+                          "fh" : r"fh",
+                          "4k" : r"4k(\d+)?",
+                         "nh4" : r"nh4",
+                          "sp" : r"sp\d+",
+                         "xnh" : r"xnh\d+(\.\d+)*",
+                         "spl" : r"spl\d+(\.\d+)*",
+                       "nh13d" : r"nh13d",
+                       "slshm" : r"slashem",
+                        "ndnh" : r"ndnh-\d+(v\d+)?",
+                       "nndnh" : r"nndnh-\d+",
+                        "evil" : r"evil\d+",
+                        "tnnt" : r"tnnt",
+                      "nhthon" : r"nethackathon",
+                        "slth" : r"slth\d+",
+                       "gnoll" : r"gnoll\d+(b\d+)?",
+                         "ace" : r"ace",
+                       "hackm" : r"hackem\d+",
+                        "nerf" : r"nerf\d+",
+                         "cre" : r"cre\d+",
+                         "dyn" : r"dyn"}
 
     # for !whereis
-    whereis = {"nh343": [FILEROOT+"nh343-hdf/var/whereis/"],
-               "nh363": [FILEROOT+"nh363-hdf/var/whereis/"],
-               "nh370": [FILEROOT+"nh370.16-hdf/var/whereis/",
-                         FILEROOT+"nh370.17-hdf/var/whereis/",
-                         FILEROOT+"nh370.18-hdf/var/whereis/",
-                         FILEROOT+"nh370.20-hdf/var/whereis/",
-                         FILEROOT+"nh370.22-hdf/var/whereis/",
-                         FILEROOT+"nh370.23-hdf/var/whereis/",
-                         FILEROOT+"nh370.27-hdf/var/whereis/",
-                         FILEROOT+"nh370.28-hdf/var/whereis/",
-                         FILEROOT+"nh370.29-hdf/var/whereis/",
-                         FILEROOT+"nh370.30-hdf/var/whereis/",
-                         FILEROOT+"nh370.31-hdf/var/whereis/",
-                         FILEROOT+"nh370.32-hdf/var/whereis/",
-                         FILEROOT+"nh370.35-hdf/var/whereis/",
-                         FILEROOT+"nh370.36-hdf/var/whereis/",
-                         FILEROOT+"nh370.38-hdf/var/whereis/",
-                         FILEROOT+"nh370.39-hdf/var/whereis/",
-                         FILEROOT+"nh370.40-hdf/var/whereis/",
-                         FILEROOT+"nh370.42-hdf/var/whereis/",
-                         FILEROOT+"nh370.43-hdf/var/whereis/",
-                         FILEROOT+"nh370.46-hdf/var/whereis/",
-                         FILEROOT+"nh370.47-hdf/var/whereis/",
-                         FILEROOT+"nh370.50-hdf/var/whereis/",
-                         FILEROOT+"nh370.51-hdf/var/whereis/",
-                         FILEROOT+"nh370.53-hdf/var/whereis/",
-                         FILEROOT+"nh370.58-hdf/var/whereis/",
-                         FILEROOT+"nh370.59-hdf/var/whereis/",
-                         FILEROOT+"nh370.60-hdf/var/whereis/",
-                         FILEROOT+"nh370.61-hdf/var/whereis/",
-                         FILEROOT+"nh370.62-hdf/var/whereis/",
-                         FILEROOT+"nh370.64-hdf/var/whereis/",
-                         FILEROOT+"nh370.65-hdf/var/whereis/",
-                         FILEROOT+"nh370.66-hdf/var/whereis/",
-                         FILEROOT+"nh370.69-hdf/var/whereis/",
-                         FILEROOT+"nh370.70-hdf/var/whereis/",
-                         FILEROOT+"nh370.71-hdf/var/whereis/",
-                         FILEROOT+"nh370.73-hdf/var/whereis/",
-                         FILEROOT+"nh370.78-hdf/var/whereis/",
-                         FILEROOT+"nh370.80-hdf/var/whereis/",
-                         FILEROOT+"nh370.82-hdf/var/whereis/",
-                         FILEROOT+"nh370.83-hdf/var/whereis/",
-                         FILEROOT+"nh370.84-hdf/var/whereis/",
-                         FILEROOT+"nh370.86-hdf/var/whereis/",
-                         FILEROOT+"nh370.87-hdf/var/whereis/",
-                         FILEROOT+"nh370.88-hdf/var/whereis/",
-                         FILEROOT+"nh370.89-hdf/var/whereis/",
-                         FILEROOT+"nh370.90-hdf/var/whereis/",
-                         FILEROOT+"nh370.94-hdf/var/whereis/",
-                         FILEROOT+"nh370.95-hdf/var/whereis/",
-                         FILEROOT+"nh370.97-hdf/var/whereis/",
-                         FILEROOT+"nh370.101-hdf/var/whereis/",
-                         FILEROOT+"nh370.102-hdf/var/whereis/",
-                         FILEROOT+"nh370.103-hdf/var/whereis/",
-                         FILEROOT+"nh370.105-hdf/var/whereis/",
-                         FILEROOT+"nh370.106-hdf/var/whereis/",
-                         FILEROOT+"nh370.107-hdf/var/whereis/",
-                         FILEROOT+"nh370.110-hdf/var/whereis/",
-                         FILEROOT+"nh370.112-hdf/var/whereis/",
-                         FILEROOT+"nh370.114-hdf/var/whereis/",
-                         FILEROOT+"nh370.115-hdf/var/whereis/",
-                         FILEROOT+"nh370.119-hdf/var/whereis/",
-                         FILEROOT+"nh370.120-hdf/var/whereis/",
-                         FILEROOT+"nh370.123-hdf/var/whereis/",
-                         FILEROOT+"nh370.124-hdf/var/whereis/",
-                         FILEROOT+"nh370.127-hdf/var/whereis/",
-                         FILEROOT+"nh370.128-hdf/var/whereis/",
-                         FILEROOT+"nh370.130-hdf/var/whereis/",
-                         FILEROOT+"nh370.132-hdf/var/whereis/",
-                         FILEROOT+"nh370.134-hdf/var/whereis/",
-                         FILEROOT+"nh370.137-hdf/var/whereis/"],
-               "nh500": [FILEROOT+"nh500.0-hdf/var/whereis/"],
-                  "gh": [FILEROOT+"grunthack-0.2.4/var/whereis/",
-                         FILEROOT+"grunthack-0.3.0/var/whereis/"],
-                 "dnh": [FILEROOT+"dnethack-3.17.1/whereis/",
-                         FILEROOT+"dnethack-3.18.0/whereis/",
-                         FILEROOT+"dnethack-3.19.0/whereis/",
-                         FILEROOT+"dnethack-3.19.1/whereis/",
-                         FILEROOT+"dnethack-3.20.0/whereis/",
-                         FILEROOT+"dnethack-3.21.0/whereis/",
-                         FILEROOT+"dnethack-3.21.1/whereis/",
-                         FILEROOT+"dnethack-3.21.2/whereis/",
-                         FILEROOT+"dnethack-3.21.3/whereis/",
-                         FILEROOT+"dnethack-3.21.4/whereis/",
-                         FILEROOT+"dnethack-3.22.0/whereis/",
-                         FILEROOT+"dnethack-3.23.0/whereis/",
-                         FILEROOT+"dnethack-3.24.0/whereis/",
-                         FILEROOT+"dnethack-3.25.0/whereis/"],
-                  "fh": [FILEROOT+"fiqhackdir/data/"],
-                 "dyn": [FILEROOT+"dynahack/dynahack-data/var/whereis/"],
-                 "nh4": [FILEROOT+"nh4dir/save/whereis/"],
-                  "4k": [FILEROOT+"fourkdir/save/",
-                         FILEROOT+"fourkdir-4.3.0.5/save/"],
-                  "sp": [FILEROOT+"sporkhack-0.6.5/var/",
-                         FILEROOT+"sporkhack-0.7.0/var/"],
-                 "xnh": [FILEROOT+"xnethack-0.4.0/var/whereis/",
-                         FILEROOT+"xnethack-0.4.1/var/whereis/",
-                         FILEROOT+"xnethack-5.0/var/whereis/",
-                         FILEROOT+"xnethack-5.1/var/whereis/",
-                         FILEROOT+"xnethack-5.1.1/var/whereis/",
-                         FILEROOT+"xnethack-5.1.2/var/whereis/",
-                         FILEROOT+"xnethack-5.1.3/var/whereis/",
-                         FILEROOT+"xnethack-6.0.0/var/whereis/",
-                         FILEROOT+"xnethack-6.1.0/var/whereis/",
-                         FILEROOT+"xnethack-6.2.0/var/whereis/",
-                         FILEROOT+"xnethack-6.3.0/var/whereis/",
-                         FILEROOT+"xnethack-7.0.0/var/whereis/",
-                         FILEROOT+"xnethack-7.0.0.1/var/whereis/",
-                         FILEROOT+"xnethack-7.1.0/var/whereis/",
-                         FILEROOT+"xnethack-8.0.0/var/whereis/",
-                         FILEROOT+"xnethack-8.0.0.1/var/whereis/",
-                         FILEROOT+"xnethack-9.0.0/var/whereis/",
-                         FILEROOT+"xnethack-9.1.0/var/whereis/"],
-                 "spl": [FILEROOT+"splicehack-0.6.3/var/whereis/",
-                         FILEROOT+"splicehack-0.6.4/var/whereis/",
-                         FILEROOT+"splicehack-0.7.0/var/whereis/",
-                         FILEROOT+"splicehack-0.7.1/var/whereis/",
-                         FILEROOT+"splicehack-0.7.1-21/var/whereis/",
-                         FILEROOT+"splicehack-0.8.0/var/whereis/",
-                         FILEROOT+"splicehack-0.8.1/var/whereis/",
-                         FILEROOT+"splicehack-0.8.2/var/whereis/",
-                         FILEROOT+"splicehack-1.0.0/var/whereis/",
-                         FILEROOT+"splicehack-1.1.0/var/whereis/",
-                         FILEROOT+"splicehack-1.2.0/var/whereis/"],
-               "nh13d": [FILEROOT+"nh13d/whereis/"],
-               "slshm": [FILEROOT+"slashem-0.0.8E0F2/whereis/"],
-                "ndnh": [FILEROOT+"notdnethack-2019.05.24/whereis/",
-                         FILEROOT+"notdnethack-2019.12.24/whereis/",
-                         FILEROOT+"notdnethack-2020.04.16/whereis/",
-                         FILEROOT+"notdnethack-2021.05.21/whereis/",
-                         FILEROOT+"notdnethack-2022.03.22/whereis/",
-                         FILEROOT+"notdnethack-2022.05.30/whereis/",
-                         FILEROOT+"notdnethack-2022.09.18/whereis/",
-                         FILEROOT+"notdnethack-2023.05.15/whereis/",
-                         FILEROOT+"notdnethack-2024.05.15/whereis/",
-                         FILEROOT+"notdnethack-2025.05.15/whereis/",
-                         FILEROOT+"notdnethack-2026.01.16/whereis/"],
-               "nndnh": [FILEROOT+"notnotdnethack-2024.05.15/whereis/",
-                         FILEROOT+"notnotdnethack-2025.05.16/whereis/",
-                         FILEROOT+"notnotdnethack-2026.01.18/whereis/"],
-                "evil": [FILEROOT+"evilhack-0.4.0/var/whereis/",
-                         FILEROOT+"evilhack-0.4.1/var/whereis/",
-                         FILEROOT+"evilhack-0.4.2/var/whereis/",
-                         FILEROOT+"evilhack-0.5.0/var/whereis/",
-                         FILEROOT+"evilhack-0.6.0/var/whereis/",
-                         FILEROOT+"evilhack-0.7.0/var/whereis/",
-                         FILEROOT+"evilhack-0.7.1/var/whereis/",
-                         FILEROOT+"evilhack-0.8.0/var/whereis/",
-                         FILEROOT+"evilhack-0.8.1/var/whereis/",
-                         FILEROOT+"evilhack-0.8.2/var/whereis/",
-                         FILEROOT+"evilhack-0.8.3/var/whereis/",
-                         FILEROOT+"evilhack-0.8.4/var/whereis/",
-                         FILEROOT+"evilhack-0.9.0/var/whereis/",
-                         FILEROOT+"evilhack-0.9.1/var/whereis/",
-                         FILEROOT+"evilhack-0.9.2/var/whereis/"],
-                "tnnt": [FILEROOT+"tnnt/var/whereis/"],
-              "nhthon": [FILEROOT+"nethackathon/var/whereis/"],
-                "slth": [FILEROOT+"slashthem-0.9.5/whereis/",
-                         FILEROOT+"slashthem-0.9.6/whereis/",
-                         FILEROOT+"slashthem-0.9.7/whereis/"],
-               "gnoll": [FILEROOT+"gnollhack-4.1.2.3/var/whereis/",
-                         FILEROOT+"gnollhack-4.1.3.16/var/whereis/",
-                         FILEROOT+"gnollhack-4.1.3.39/var/whereis/",
-                         FILEROOT+"gnollhack-4.1.3.50/var/whereis/",
-                         FILEROOT+"gnollhack-4.1.3.52/var/whereis/",
-                         FILEROOT+"gnollhack-4.2.0.16/var/whereis/",
-                         FILEROOT+"gnollhack-4.2.0.20/var/whereis/",
-                         FILEROOT+"gnollhack-4.2.0.41/var/whereis/",
-                         FILEROOT+"gnollhack-4.2.0.85/var/whereis/"],
-               "hackm": [FILEROOT+"hackem-1.0.0/var/whereis/",
-                         FILEROOT+"hackem-1.1.0/var/whereis/",
-                         FILEROOT+"hackem-1.1.4/var/whereis/",
-                         FILEROOT+"hackem-1.2.0/var/whereis/",
-                         FILEROOT+"hackem-1.2.2/var/whereis/",
-                         FILEROOT+"hackem-1.3.0/var/whereis/",
-                         FILEROOT+"hackem-1.3.1/var/whereis/",
-                         FILEROOT+"hackem-1.3.2/var/whereis/"],
-                "nerf": [FILEROOT+"nerfhack-2.0.0/var/whereis/",
-                         FILEROOT+"nerfhack-2.1.0/var/whereis/",
-                         FILEROOT+"nerfhack-2.2.1/var/whereis/"],
-                 "cre": [FILEROOT+"crecellehack-1.0.0/var/whereis/",
-                         FILEROOT+"crecellehack-1.0.1/var/whereis/",
-                         FILEROOT+"crecellehack-1.2.2/var/whereis/",
-                         FILEROOT+"crecellehack-1.4.0/var/whereis/",
-                         FILEROOT+"crecellehack-1.4.2/var/whereis/",
-                         FILEROOT+"crecellehack-1.5.0/var/whereis/"],
-                  "un": [FILEROOT+"un531/var/unnethack/",
-                         FILEROOT+"un532/var/unnethack/",
-                         FILEROOT+"unnethack-6.0.0/var/unnethack/",
-                         FILEROOT+"unnethack-6.0.1/var/unnethack/",
-                         FILEROOT+"unnethack-6.0.2/var/unnethack/",
-                         FILEROOT+"unnethack-6.0.3/var/unnethack/",
-                         FILEROOT+"unnethack-6.0.4/var/unnethack/",
-                         FILEROOT+"unnethack-6.0.5/var/unnethack/",
-                         FILEROOT+"unnethack-6.0.6/var/unnethack/",
-                         FILEROOT+"unnethack-6.0.7/var/whereis/",
-                         FILEROOT+"unnethack-6.0.8/var/whereis/",
-                         FILEROOT+"unnethack-6.0.9/var/whereis/",
-                         FILEROOT+"unnethack-6.0.10/var/whereis/",
-                         FILEROOT+"unnethack-6.0.11/var/whereis/",
-                         FILEROOT+"unnethack-6.0.12/var/whereis/",
-                         FILEROOT+"unnethack-6.0.13/var/whereis/",
-                         FILEROOT+"unnethack-6.0.14/var/whereis/",
-                         FILEROOT+"unnethack-6.0.15/var/whereis/"]}
+    # variant -> (pattern for FILEROOT/<name>/, whereis dirs under it)
+    whereisPatterns = {"nh343": (r"nh343-hdf", ["var/whereis/"]),
+                       "nh363": (r"nh363-hdf", ["var/whereis/"]),
+                       "nh370": (r"nh370\.\d+-hdf", ["var/whereis/"]),
+                       "nh500": (r"nh500\.\d+-hdf", ["var/whereis/"]),
+                          "gh": (r"grunthack-[\d.]+", ["var/whereis/"]),
+                         "dnh": (r"dnethack-[\d.]+", ["whereis/"]),
+                          "fh": (r"fiqhackdir", ["data/"]),
+                          "4k": (r"fourkdir(-[\d.]+)?", ["save/"]),
+                         "dyn": (r"dynahack", ["dynahack-data/var/whereis/"]),
+                         "nh4": (r"nh4dir", ["save/whereis/"]),
+                          "sp": (r"sporkhack-[\d.]+", ["var/"]),
+                         "xnh": (r"xnethack-[\d.]+", ["var/whereis/"]),
+                         "spl": (r"splicehack-[\d.]+(-\d+)?", ["var/whereis/"]),
+                       "nh13d": (r"nh13d", ["whereis/"]),
+                       "slshm": (r"slashem-0\.0\.8E0F2", ["whereis/"]),
+                        "ndnh": (r"notdnethack-[\d.]+", ["whereis/"]),
+                       "nndnh": (r"notnotdnethack-[\d.]+", ["whereis/"]),
+                        "evil": (r"evilhack-[\d.]+", ["var/whereis/"]),
+                        "tnnt": (r"tnnt", ["var/whereis/"]),
+                      "nhthon": (r"nethackathon", ["var/whereis/"]),
+                        "slth": (r"slashthem-[\d.]+", ["whereis/"]),
+                       "gnoll": (r"gnollhack-[\d.]+", ["var/whereis/"]),
+                       "hackm": (r"hackem-[\d.]+", ["var/whereis/"]),
+                        "nerf": (r"nerfhack-[\d.]+", ["var/whereis/"]),
+                         "cre": (r"crecellehack-[\d.]+", ["var/whereis/"]),
+                          # older versions keep whereis files with the save files
+                          "un": (r"un\d+|unnethack-[\d.]+", ["var/unnethack/", "var/whereis/"])}
 
     dungeons = {"nh343": ["The Dungeons of Doom","Gehennom","The Gnomish Mines","The Quest",
                           "Sokoban","Fort Ludios","Vlad's Tower","The Elemental Planes"],
@@ -995,6 +1987,7 @@ class DeathBotProtocol(irc.IRCClient):
     # copied from https://github.com/habnabit/txsocksx/blob/master/examples/tor-irc.py
     # irc_CAP and irc_9xx are UNDOCUMENTED.
     def connectionMade(self):
+        self.outq = OutboundQueue(self.sendLine, OUTBOUND_RATE, OUTBOUND_BURST)
         self.sendLine('CAP REQ :sasl')
         #self.deferred = Deferred()
         irc.IRCClient.connectionMade(self)
@@ -1024,89 +2017,17 @@ class DeathBotProtocol(irc.IRCClient):
         if not SLAVE: self.join(CHANNEL)
         random.seed()
 
-        # Track bot start time for uptime calculation
-        self.starttime = time.time()
-
-        self._initializeLogs()
-        self._initializeGameTracking()
-        self._initializeStreaks()
-        self._initializeAscensions()
-        self._initializeDatabases()
         self._initializeCommands()
         self._initializeRateLimiting()
-        self._seekToEndOfLivelogs()
-        self._populateHistoricalData()
+        self._initializeReddit()
         self._startMonitoringTasks()
 
-    def _initializeLogs(self):
-        """Initialize log file tracking"""
-        self.logs = {}
-        for xlogfile, (variant, delim, dumpfmt) in self.xlogfiles.items():
-            self.logs[xlogfile] = (self.xlogfileReport, variant, delim, dumpfmt)
-        for livelog, (variant, delim) in self.livelogs.items():
-            self.logs[livelog] = (self.livelogReport, variant, delim, "")
-
-        self.logs_seek = {}
-        self.looping_calls = {}
-
-    def _initializeGameTracking(self):
-        """Initialize last game tracking"""
-        self.lastgame = "No last game recorded"
-        self.lg = {}
-        self.lastasc = "No last ascension recorded"
-        self.la = {}
-        # for populating lg/la per player at boot, we need to track game end times
-        # variant and variant:player don't need this if we assume the xlogfiles are
-        # ordered within variant.
-        self.lge = {}
-        self.tlastgame = 0
-        self.lae = {}
-        self.tlastasc = 0
-
-    def _initializeStreaks(self):
-        """Initialize streak tracking"""
-        self.curstreak = {}
-        self.longstreak = {}
-        for v in self.streakvars:
-            # curstreak[var][player] = (start, end, length)
-            self.curstreak[v] = {}
-            # longstreak - as above
-            self.longstreak[v] = {}
-
-    def _initializeAscensions(self):
-        """Initialize ascension tracking"""
-        # ascensions (for !asc)
-        # "!asc plr var" will give something like Rodney's output.
-        # "!asc plr" will give breakdown by variant.
-        # "!asc" or "!asc var" will be as above, assuming requestor's nick.
-        # asc[var][player][role] = count;
-        # asc[var][player][race] = count;
-        # asc[var][player][align] = count;
-        # asc[var][player][gender] = count;
-        # assumes 3-char abbreviations for role/race/align/gender, and no overlaps.
-        # for asc ratio we need total games too
-        # allgames[var][player] = count;
-        self.asc = {}
-        self.allgames = {}
-        for v in self.variants:
-            self.asc[v] = {};
-            self.allgames[v] = {};
-
-    def _initializeDatabases(self):
-        """Initialize shelve databases"""
-        # for !tell
-        try:
-            self.tellbuf = shelve.open(BOTDIR + "/tellmsg.db", writeback=False)
-        except (OSError, IOError):
-            self.tellbuf = shelve.open(BOTDIR + "/tellmsg", writeback=False, protocol=2)
+        # game tracking lives in the factory's service, which survives reconnects
+        self.service = self.factory.service
+        self.service.attach(self)
 
-        # for !setmintc
-        try:
-            self.plr_tc = shelve.open(BOTDIR + "/plrtc.db", writeback=False)
-        except (OSError, IOError):
-            self.plr_tc = shelve.open(BOTDIR + "/plrtc", writeback=False, protocol=2)
-
-        # for Reddit monitoring
+    def _initializeReddit(self):
+        """Initialize Reddit monitoring state"""
         self.seen_reddit_posts = []
         self.reddit_initialized = False
 
@@ -1159,6 +2080,7 @@ class DeathBotProtocol(irc.IRCClient):
                          "rumor"    : self.doRumor,
                          "rumour"   : self.doRumor,
                          "status"   : self.doStatus,
+                         "slow"     : self.doSlow,
                          # these ones are for control messages between master and slaves
                          # sender is checked, so these can't be used by the public
                          "#q#"      : self.doQuery,
@@ -1178,10 +2100,8 @@ class DeathBotProtocol(irc.IRCClient):
                           "whereis" : self.outWhereIs,
                           "asc"     : self.outAscStreak,
                           "streak"  : self.outAscStreak,
-                          # TODO: timestamp these so we can report the very last one
-                          # For now, use the !asc/!streak callback as it's generic enough
-                          "lastasc" : self.outAscStreak,
-                          "lastgame": self.outAscStreak,
+                          "lastasc" : self.outLastGame,
+                          "lastgame": self.outLastGame,
                           "setmintc": self.outPlrTC}
 
         # checkUsage outputs a message and returns false if input is bad
@@ -1194,30 +2114,8 @@ class DeathBotProtocol(irc.IRCClient):
                           "setmintc": self.usagePlrTC}
 
     def _initializeRateLimiting(self):
-        """Initialize rate limiting tracking with crash-safe defaults"""
-        try:
-            # Rate limiting: track commands per minute
-            self.rate_limits = {}  # user -> list of command timestamps
-
-            # Abuse detection: track consecutive command patterns
-            self.abuse_penalties = {}  # user -> penalty end timestamp
-            self.consecutive_commands = {}  # user -> [command_time, command_time, ...]
-
-            # Response rate limiting: prevent penalty message spam
-            self.penalty_responses = {}  # user -> [timestamp, timestamp, ...]
-
-            # Burst protection: prevent multiple commands per second
-            self.last_command_time = {}  # user -> timestamp of last command
-
-            tlog("Rate limiting initialized successfully")
-        except Exception as e:
-            tlog(f"Warning: Rate limiting initialization failed: {e}")
-            # Ensure safe defaults even if initialization fails
-            self.rate_limits = {}
-            self.abuse_penalties = {}
-            self.consecutive_commands = {}
-            self.penalty_responses = {}
-            self.last_command_time = {}
+        """Initialize rate limiting tracking"""
+        self.ratelimiter = RateLimiter()
 
     def _checkRateLimit(self, sender, command):
         """
@@ -1226,65 +2124,7 @@ class DeathBotProtocol(irc.IRCClient):
         Uses fail-safe approach - if anything breaks, allow the command.
         """
         try:
-            now = time.time()
-
-            # Check if user is currently under abuse penalty
-            if sender in self.abuse_penalties:
-                if now < self.abuse_penalties[sender]:
-                    return False  # Still under penalty
-                else:
-                    # Penalty expired, clean up
-                    del self.abuse_penalties[sender]
-                    if sender in self.consecutive_commands:
-                        del self.consecutive_commands[sender]
-
-            # Clean up old rate limit entries (older than 60 seconds)
-            if sender in self.rate_limits:
-                self.rate_limits[sender] = [
-                    timestamp for timestamp in self.rate_limits[sender]
-                    if now - timestamp < RATE_LIMIT_WINDOW
-                ]
-
-                # Remove empty entries
-                if not self.rate_limits[sender]:
-                    del self.rate_limits[sender]
-
-            # Initialize user's rate limit tracking if needed
-            if sender not in self.rate_limits:
-                self.rate_limits[sender] = []
-
-            # Apply rate limit to all commands
-            limit = RATE_LIMIT_COMMANDS
-
-            # Check if user has exceeded rate limit
-            if len(self.rate_limits[sender]) >= limit:
-                return False  # Rate limited
-
-            # Record this command attempt
-            self.rate_limits[sender].append(now)
-
-            # Track consecutive commands for abuse detection
-            if sender not in self.consecutive_commands:
-                self.consecutive_commands[sender] = []
-
-            # Clean up old consecutive command entries (older than ABUSE_WINDOW)
-            self.consecutive_commands[sender] = [
-                timestamp for timestamp in self.consecutive_commands[sender]
-                if now - timestamp < ABUSE_WINDOW
-            ]
-
-            # Add this command to consecutive tracking
-            self.consecutive_commands[sender].append(now)
-
-            # Check for abuse pattern (too many commands within ABUSE_WINDOW)
-            if len(self.consecutive_commands[sender]) >= ABUSE_THRESHOLD:
-                # Impose abuse penalty
-                self.abuse_penalties[sender] = now + ABUSE_PENALTY
-                self.consecutive_commands[sender] = []
-                return False  # Block this command and future commands for penalty period
-
-            return True  # Allow command
-
+            return self.ratelimiter.allowCommand(sender)
         except Exception as e:
             tlog(f"Rate limiting error for {sender}: {e}")
             # Fail-safe: allow command if rate limiting breaks
@@ -1296,26 +2136,7 @@ class DeathBotProtocol(irc.IRCClient):
         Returns True if we should send the message, False if we should silently ignore.
         """
         try:
-            now = time.time()
-
-            # Initialize penalty response tracking for this user
-            if sender not in self.penalty_responses:
-                self.penalty_responses[sender] = []
-
-            # Clean up old penalty response entries (older than RESPONSE_RATE_WINDOW)
-            self.penalty_responses[sender] = [
-                timestamp for timestamp in self.penalty_responses[sender]
-                if now - timestamp < RESPONSE_RATE_WINDOW
-            ]
-
-            # Check if user has exceeded penalty message rate limit
-            if len(self.penalty_responses[sender]) >= RESPONSE_RATE_LIMIT:
-                return False  # Don't send penalty message
-
-            # Record this penalty response
-            self.penalty_responses[sender].append(now)
-            return True  # Send penalty message
-
+            return self.ratelimiter.allowPenaltyMessage(sender)
         except Exception as e:
             tlog(f"Penalty response rate limiting error for {sender}: {e}")
             # Fail-safe: allow penalty message if checking breaks
@@ -1327,61 +2148,17 @@ class DeathBotProtocol(irc.IRCClient):
         Returns True if command should be allowed, False if it should be silently ignored.
         """
         try:
-            now = time.time()
-
-            # Apply burst protection to all commands
-            burst_window = BURST_WINDOW
-
-            # Check if user sent a command too recently
-            if sender in self.last_command_time:
-                time_since_last = now - self.last_command_time[sender]
-                if time_since_last < burst_window:
-                    return False  # Silently ignore burst commands
-
-            # Update last command time
-            self.last_command_time[sender] = now
-            return True  # Allow command
-
+            return self.ratelimiter.allowBurst(sender)
         except Exception as e:
             tlog(f"Burst protection error for {sender}: {e}")
             # Fail-safe: allow command if burst protection breaks
             return True
 
-    def _seekToEndOfLivelogs(self):
-        """Seek to end of livelog files"""
-
-        # seek to end of livelogs
-        for filepath in self.livelogs:
-            with filepath.open("r") as handle:
-                handle.seek(0, 2)
-                self.logs_seek[filepath] = handle.tell()
-
-    def _populateHistoricalData(self):
-        """Read xlogfiles to populate historical game data"""
-        # sequentially read xlogfiles from beginning to pre-populate lastgame data.
-        for filepath in self.xlogfiles:
-            with filepath.open("r") as handle:
-                for line in handle:
-                    delim = self.logs[filepath][2]
-                    game = parse_xlogfile_line(line, delim)
-                    game["variant"] = self.logs[filepath][1]
-                    if game["variant"] == "fh":
-                        game["dumplog"] = fixdump(game["dumplog"])
-                    if game["variant"] == "nh4":
-                        game["dumplog"] = fixdump(game["dumplog"])
-                    game["dumpfmt"] = self.logs[filepath][3]
-                    for line in self.logs[filepath][0](game,False):
-                        pass
-                self.logs_seek[filepath] = handle.tell()
-
     def _startMonitoringTasks(self):
         """Start periodic monitoring tasks"""
-        # poll logs for updates every LOG_CHECK_INTERVAL seconds
-        for filepath in self.logs:
-            self.looping_calls[filepath] = task.LoopingCall(self.logReport, filepath)
-            self.looping_calls[filepath].start(LOG_CHECK_INTERVAL)
+        self.looping_calls = {}
 
-        # Additionally, keep an eye on our nick to make sure it's right.
+        # Keep an eye on our nick to make sure it's right.
         # Perhaps we only need to set this up if the nick was originally
         # in use when we signed on, but a 30-second looping call won't kill us
         self.looping_calls["nick"] = task.LoopingCall(self.nickCheck)
@@ -1403,33 +2180,9 @@ class DeathBotProtocol(irc.IRCClient):
             self.setNick(NICK)
 
     def cleanupOldData(self):
-        """Clean up old undelivered messages and limit cache sizes"""
+        """Clean up stale queries and limit cache sizes"""
         now = time.time()
 
-        # Clean up undelivered !tell messages older than 180 days
-        try:
-            old_recipients = []
-            for recipient in self.tellbuf:
-                messages = self.tellbuf[recipient]
-                # Filter out messages older than 180 days
-                new_messages = [(fwd, sender, ts, msg) for (fwd, sender, ts, msg) in messages
-                               if now - ts < 180 * 24 * 3600]
-                if new_messages != messages:
-                    if new_messages:
-                        self.tellbuf[recipient] = new_messages
-                    else:
-                        old_recipients.append(recipient)
-
-            # Delete empty entries
-            for recipient in old_recipients:
-                del self.tellbuf[recipient]
-
-            if old_recipients:
-                self.tellbuf.sync()
-                tlog(f"Cleaned up old messages for {len(old_recipients)} recipients")
-        except Exception as e:
-            tlog(f"Error cleaning up tellbuf: {e}")
-
         # Clean up stale queries older than 1 hour (in case timeoutQuery failed)
         try:
             stale_queries = []
@@ -1448,107 +2201,10 @@ class DeathBotProtocol(irc.IRCClient):
         except Exception as e:
             tlog(f"Error cleaning up queries: {e}")
 
-        # Limit rumor cache to 50 most recent entries
-        if len(self.rumorCache) > 50:
-            # Sort by timestamp and keep newest 50
-            sorted_items = sorted(self.rumorCache.items(), key=lambda x: x[1][0], reverse=True)
-            self.rumorCache = dict(sorted_items[:50])
-            tlog(f"Trimmed rumor cache to 50 entries")
-
-        # Clean up old rate limiting entries
-        try:
-            users_to_clean = []
-            for user in list(self.rate_limits.keys()):
-                # Remove timestamps older than rate limit window
-                self.rate_limits[user] = [
-                    timestamp for timestamp in self.rate_limits[user]
-                    if now - timestamp < RATE_LIMIT_WINDOW
-                ]
-                # Remove empty entries
-                if not self.rate_limits[user]:
-                    users_to_clean.append(user)
-
-            for user in users_to_clean:
-                del self.rate_limits[user]
-
-            if users_to_clean:
-                tlog(f"Cleaned up rate limiting for {len(users_to_clean)} users")
-        except Exception as e:
-            tlog(f"Error cleaning up rate limits: {e}")
-
-        # Clean up expired abuse penalties and reset old consecutive counters
-        try:
-            expired_penalties = []
-            for user in list(self.abuse_penalties.keys()):
-                if now >= self.abuse_penalties[user]:
-                    expired_penalties.append(user)
-
-            for user in expired_penalties:
-                del self.abuse_penalties[user]
-                if user in self.consecutive_commands:
-                    del self.consecutive_commands[user]
-
-            # Clean up old consecutive command entries (older than 24 hours)
-            old_consecutive = []
-            for user in list(self.consecutive_commands.keys()):
-                if isinstance(self.consecutive_commands[user], list):
-                    # Clean up old timestamps from consecutive commands list
-                    self.consecutive_commands[user] = [
-                        timestamp for timestamp in self.consecutive_commands[user]
-                        if now - timestamp < 86400  # 24 hours
-                    ]
-                    if not self.consecutive_commands[user]:
-                        old_consecutive.append(user)
-                else:
-                    # Old format - clean up if user inactive for 24 hours
-                    if user in self.rate_limits and self.rate_limits[user]:
-                        last_command = max(self.rate_limits[user])
-                        if now - last_command > 86400:
-                            old_consecutive.append(user)
-                    elif user not in self.rate_limits:
-                        old_consecutive.append(user)
-
-            for user in old_consecutive:
-                self.consecutive_commands.pop(user, None)
-
-            if expired_penalties or old_consecutive:
-                tlog(f"Cleaned up abuse tracking: {len(expired_penalties)} expired penalties, {len(old_consecutive)} old counters")
-        except Exception as e:
-            tlog(f"Error cleaning up abuse tracking: {e}")
-
-        # Clean up old penalty response tracking and burst protection data
-        try:
-            cleaned_responses = 0
-            cleaned_burst = 0
-
-            # Clean up penalty response tracking (older than RESPONSE_RATE_WINDOW)
-            for user in list(self.penalty_responses.keys()):
-                old_count = len(self.penalty_responses[user])
-                self.penalty_responses[user] = [
-                    timestamp for timestamp in self.penalty_responses[user]
-                    if now - timestamp < RESPONSE_RATE_WINDOW
-                ]
-                if not self.penalty_responses[user]:
-                    del self.penalty_responses[user]
-                    cleaned_responses += 1
-                elif len(self.penalty_responses[user]) < old_count:
-                    cleaned_responses += 1
-
-            # Clean up burst protection data for inactive users (>24 hours)
-            for user in list(self.last_command_time.keys()):
-                if now - self.last_command_time[user] > 86400:  # 24 hours
-                    del self.last_command_time[user]
-                    cleaned_burst += 1
-
-            if cleaned_responses or cleaned_burst:
-                tlog(f"Cleaned up rate limiting: {cleaned_responses} penalty responses, {cleaned_burst} burst data")
-
-        except Exception as e:
-            tlog(f"Error cleaning up penalty/burst data: {e}")
-
     def nickChanged(self, nn):
         # catch successful changing of nick from above and identify with nickserv
-        self.msg("NickServ", "identify " + nn + " " + self.password)
+        self.msg("NickServ", "identify " + nn + " " + self.password,
+                 priority=OutboundQueue.CONTROL)
 
     #helper functions
     #lookup canonical variant id from alias
@@ -1561,35 +2217,21 @@ class DeathBotProtocol(irc.IRCClient):
         # this is used for variant/player agnosticism in !lastgame
         return alias
 
-    def logRotate(self):
-        self.chanLog.close()
-        self.logday = time.strftime("%d")
-        self.chanLogName = LOGROOT + CHANNEL + time.strftime("-%Y-%m-%d.log")
-        self.chanLog = open(self.chanLogName,'a') # 'w' is probably fine here
-        os.chmod(self.chanLogName,stat.S_IRUSR|stat.S_IWUSR|stat.S_IRGRP|stat.S_IROTH)
-
     def stripText(self, msg):
         # strip the colour control stuff out
-        # This can probably all be done with a single RE but I have a headache.
-        message = RE_COLOR_FG_BG.sub('', msg) # fg,bg pair
-        message = RE_COLOR_FG.sub('', message) # fg only
-        message = RE_COLOR_END.sub('', message) # end of colour and italics
-        return message
+        return RE_COLOR.sub('', msg)
 
     # Write log
     def log(self, message):
         if SLAVE: return
-        message = self.stripText(message)
-        if time.strftime("%d") != self.logday: self.logRotate()
-        self.chanLog.write(time.strftime("%H:%M ") + message + "\n")
-        self.chanLog.flush()
+        self.chanLog.write(self.stripText(message))
 
     # wrapper for "msg" that logs if msg dest is channel
     # Need to log our own actions separately as they don't trigger events
-    def msgLog(self, replyto, message):
+    def msgLog(self, replyto, message, priority=OutboundQueue.REPLY, origin=None):
         if replyto == CHANNEL:
             self.log("<" + self.nickname + "> " + message)
-        self.msg(replyto, message)
+        self.msg(replyto, message, priority=priority, origin=origin)
 
     # Similar wrapper for describe
     def describeLog(self,replyto, message):
@@ -1673,14 +2315,19 @@ class DeathBotProtocol(irc.IRCClient):
             self.queries[msgwords[1]]["resp"][sender] = " ".join(msgwords[2:])
             if set(self.queries[msgwords[1]]["resp"]) >= set(self.slaves):
                 #all slaves have responded
-                self.queries[msgwords[1]]["callback"](self.queries.pop(msgwords[1]))
+                self.finishQuery(msgwords[1])
         else:
             tlog("Bogus slave response from " + sender + ": " + " ".join(msgwords));
 
     def timeoutQuery(self, query):
         if query not in self.queries: return # query was completed before timeout
         # probably should handle the 'no slaves responded' case better than this.
-        self.queries[query]["callback"](self.queries.pop(query))
+        self.finishQuery(query)
+
+    def finishQuery(self, query):
+        q = self.queries.pop(query)
+        self.service.perf.record("query", q["command"], time.time() - q["timestamp"])
+        q["callback"](q)
 
     # implement commands here
     def doPing(self, sender, replyto, msgwords):
@@ -1905,29 +2552,26 @@ class DeathBotProtocol(irc.IRCClient):
             mem_mb = "N/A"
 
         # Calculate uptime
-        uptime_seconds = int(time.time() - self.starttime)
+        uptime_seconds = int(time.time() - self.service.starttime)
         uptime_days = uptime_seconds // 86400
         uptime_hours = (uptime_seconds % 86400) // 3600
         uptime_mins = (uptime_seconds % 3600) // 60
 
         # Count active file monitors
-        monitor_count = 0
-        for v in self.xlogfiles:
-            monitor_count += len(self.xlogfiles[v])
-        for v in self.livelogs:
-            monitor_count += len(self.livelogs[v])
+        monitor_count = len(self.service.logs)
+        monitor_mode = self.service.watcher.mode
 
         # Count queries in queue
         query_count = len(self.queries) if hasattr(self, 'queries') else 0
 
         # Count cached messages
-        msg_count = len(self.tellbuf) if hasattr(self, 'tellbuf') else 0
+        msg_count = len(self.service.tellbuf)
 
-        # Count rate limited users
-        rate_limit_count = len(self.rate_limits) if hasattr(self, 'rate_limits') else 0
+        # Count hosts with recent commands
+        rate_limit_count = len(self.ratelimiter)
 
         # Count users under abuse penalty
-        abuse_penalty_count = len(self.abuse_penalties) if hasattr(self, 'abuse_penalties') else 0
+        abuse_penalty_count = self.ratelimiter.penalized()
 
         # Build status message
         status_parts = []
@@ -1935,10 +2579,14 @@ class DeathBotProtocol(irc.IRCClient):
         status_parts.append(f"Uptime: {uptime_days}d {uptime_hours}h {uptime_mins}m")
         if mem_mb != "N/A":
             status_parts.append(f"Memory: {mem_mb:.1f}MB")
-        status_parts.append(f"Monitors: {monitor_count}")
+        status_parts.append(f"AscStore: {len(self.service.asc.players)} players, "
+                            f"{self.service.asc.size() / (1024 * 1024):.1f}MB")
+        status_parts.append(f"Monitors: {monitor_count} ({monitor_mode})")
         status_parts.append(f"Queries: {query_count}")
         status_parts.append(f"Messages: {msg_count}")
-        status_parts.append(f"RateLimit: {rate_limit_count}")
+        status_parts.append(f"RateLimit: {rate_limit_count}/{self.ratelimiter.capacity} "
+                            f"({self.ratelimiter.expired} expired, {self.ratelimiter.evicted} evicted)")
+        status_parts.append(f"OutQ: {len(self.outq)} ({self.outq.coalesced} coalesced)")
         if abuse_penalty_count > 0:
             status_parts.append(f"AbusePenalty: {abuse_penalty_count}")
 
@@ -1947,8 +2595,31 @@ class DeathBotProtocol(irc.IRCClient):
             reddit_count = len(self.seen_reddit_posts)
             status_parts.append(f"Reddit: {reddit_count} posts tracked")
 
+        # Timings: reactor lag, command handlers, log file reports, query round trips
+        perf_parts = []
+        for category in ("lag", "cmd", "log", "query"):
+            p50 = self.service.perf.percentile(category, 50)
+            if p50 is not None:
+                p99 = self.service.perf.percentile(category, 99)
+                perf_parts.append(f"{category} {p50 * 1000:.1f}/{p99 * 1000:.1f}")
+        if perf_parts:
+            status_parts.append("p50/p99ms: " + ", ".join(perf_parts))
+
         self.respond(replyto, sender, " | ".join(status_parts))
 
+    def doSlow(self, sender, replyto, msgwords):
+        if sender not in self.admin:
+            self.respond(replyto, sender, "Admin access required.")
+            return
+        slowest = self.service.perf.slowest(PERF_SLOW_REPORT)
+        if not slowest:
+            self.respond(replyto, sender, "Nothing timed yet.")
+            return
+        now = time.time()
+        self.respond(replyto, sender, "Slowest: " + ", ".join(
+                     f"{category} {label} {seconds * 1000:.1f}ms ({int(now - when)}s ago)"
+                     for (seconds, category, label, when) in slowest))
+
     # The following started as !tea resulting in the bot making a cup of tea.
     # Now it does other stuff.
     bev = { "serves": ["delivers", "tosses", "passes", "pours", "hands", "throws", "zaps", "flings", "hurls", "lobs", "beams up", "gifts", "slides"],
@@ -2004,38 +2675,6 @@ class DeathBotProtocol(irc.IRCClient):
                 + " at " + str(temp)
                 + " " + tempunit + ".")
 
-    # Cache for saving rumors files so it doesn't need to redownload them all the time.
-    # Data structure is { url: (timestamp, ["rumor1", "rumor2", ...]) }
-    rumorCache = {}
-
-    # Helper for accessing the cache.
-    # Entries are considered out of date if more than an hour old and will be redownloaded.
-    # Return rumors list if successful, False if some error.
-    def rumorCacheGet(self, url):
-        now = time.time()
-        if not url in self.rumorCache or now > self.rumorCache[url][0] + 3600:
-            tlog(f"url {url} not found or expired in rumor cache, downloading...")
-            try:
-                r = requests.get(url, timeout=10)
-                if r.status_code != requests.codes.ok:
-                    tlog(f"Failed to fetch {url}: HTTP {r.status_code}")
-                    return False
-
-                # filter out comments (# at start of line) and blanks, no point saving them
-                rumors = [r for r in filter(lambda r : len(r) > 0 and r[0] != '#', r.text.splitlines())]
-                self.rumorCache[url] = (now, rumors)
-            except requests.exceptions.Timeout:
-                tlog(f"Timeout fetching {url}")
-                return False
-            except requests.exceptions.ConnectionError as e:
-                tlog(f"Connection error fetching {url}: {e}")
-                return False
-            except requests.exceptions.RequestException as e:
-                tlog(f"Error fetching {url}: {e}")
-                return False
-
-        return self.rumorCache[url][1]
-
     def doRumor(self, sender, replyto, msgwords):
         '''
         !rumor                                         => random rumor from vanilla
@@ -2090,25 +2729,40 @@ class DeathBotProtocol(irc.IRCClient):
         else:
             url = 'https://raw.githubusercontent.com/' + self.variants[variant][3] + '/dat/rumors.' + suffix
 
-        rumors = self.rumorCacheGet(url)
-        if rumors == False:
+        urls = [url]
+        if getBoth:
+            urls.append(url[:-3] + 'fal') # url was forced to 'tru' earlier...
+        # fetch off the reactor thread; reply when we have them
+        d = defer.gatherResults([self.service.rumors.get(u) for u in urls])
+        d.addCallback(self.replyRumor, replyto, match)
+        d.addErrback(lambda f: tlog(f"Error answering !rumor: {f.value}"))
+
+    def replyRumor(self, results, replyto, match):
+        if False in results:
             self.msgLog(replyto, "Sorry, I couldn't get the rumors file.")
             return
-        if getBoth:
-            url = url[:-3] + 'fal' # url was forced to 'tru' earlier...
-            moreRumors = self.rumorCacheGet(url)
-            if moreRumors == False:
-                self.msgLog(replyto, "Sorry, I couldn't get the rumors file.")
+
+        # potential future improvement: grab and cache a copy of the vanilla
+        # rumors, and bias against picking one of those if a variant is specified
+
+        if match is None:
+            # pick from all the files as one, without joining them up
+            total = sum(len(corpus) for corpus in results)
+            if total == 0:
+                self.msgLog(replyto, "Sorry, that rumors file is empty.")
                 return
-            rumors += moreRumors
+            n = random.randrange(total)
+            for corpus in results:
+                if n < len(corpus): break
+                n -= len(corpus)
+            self.msgLog(replyto, corpus.rumors[n])
+            return
 
         # Simple (case insensitive) string match; this could be a regex match
         # but that's probably overkill
-        if match is not None:
-            rumors = [r for r in filter(lambda r : match.lower() in r.lower(), rumors)]
-
-        # potential future improvement: grab and cache a copy of the vanilla
-        # rumors, and bias against picking one of those if a variant is specified
+        rumors = []
+        for corpus in results:
+            rumors += corpus.search(match)
 
         if len(rumors) == 0:
             self.msgLog(replyto, 'No rumors matching "' + match + '".')
@@ -2122,12 +2776,26 @@ class DeathBotProtocol(irc.IRCClient):
         if SLAVE:
             return  # Only master bot monitors Reddit
 
-        try:
-            # Reddit RSS feed for r/nethack new posts (returns Atom format)
-            url = "https://www.reddit.com/r/nethack/new.rss"
-            headers = {"User-Agent": "Beholder IRC Bot/1.0"}
+        # Reddit RSS feed for r/nethack new posts (returns Atom format)
+        url = "https://www.reddit.com/r/nethack/new.rss"
+        headers = {"User-Agent": "Beholder IRC Bot/1.0"}
 
-            r = requests.get(url, headers=headers, timeout=10)
+        # returning the Deferred stops the LoopingCall overlapping a slow fetch
+        d = self.service.http.get(url, headers=headers)
+        d.addCallbacks(self.parseReddit, self.redditFetchFailed)
+        return d
+
+    def redditFetchFailed(self, f):
+        if f.check(requests.exceptions.Timeout):
+            tlog("Timeout checking Reddit RSS")
+        elif f.check(requests.exceptions.RequestException):
+            tlog(f"Error fetching Reddit RSS: {f.value}")
+        else:
+            tlog(f"Unexpected error checking Reddit: {f.value}")
+
+    def parseReddit(self, r):
+        """Announce new posts from a fetched r/nethack RSS/Atom feed"""
+        try:
             if r.status_code != 200:
                 tlog(f"Reddit RSS returned status {r.status_code}")
                 return
@@ -2218,7 +2886,8 @@ class DeathBotProtocol(irc.IRCClient):
                         shortlink = f"https://redd.it/{post_id}"
 
                         # Announce to channel
-                        self.msgLog(CHANNEL, f"\x0307Reddit\x03: {title} {shortlink}")
+                        self.msgLog(CHANNEL, f"\x0307Reddit\x03: {title} {shortlink}",
+                                    priority=OutboundQueue.ANNOUNCE)
 
             # Mark as initialized after first check
             self.reddit_initialized = True
@@ -2228,10 +2897,6 @@ class DeathBotProtocol(irc.IRCClient):
             if len(self.seen_reddit_posts) > 100:
                 self.seen_reddit_posts = self.seen_reddit_posts[-100:]
 
-        except requests.exceptions.Timeout:
-            tlog("Timeout checking Reddit RSS")
-        except requests.exceptions.RequestException as e:
-            tlog(f"Error fetching Reddit RSS: {e}")
         except ET.ParseError as e:
             tlog(f"Error parsing Reddit RSS XML: {e}")
         except Exception as e:
@@ -2254,18 +2919,11 @@ class DeathBotProtocol(irc.IRCClient):
             message = "[private] " + message
         else: # !tell on channel
             forwardto = replyto # so pass to channel
-        rcpt_lower = rcpt.lower()
-        messages = self.tellbuf.get(rcpt_lower, [])
-
         # Prevent memory leaks by limiting total tell messages
-        total_messages = sum(len(msgs) for msgs in self.tellbuf.values())
-        if total_messages >= MAX_TELLBUF_MESSAGES:
+        if not self.service.tellbuf.add(rcpt.lower(), forwardto, sender, time.time(), message):
             self.respond(replyto, sender, "Tell message limit reached, try again later")
             return
 
-        messages.append((forwardto,sender,time.time(),message))
-        self.tellbuf[rcpt_lower] = messages
-        self.tellbuf.sync()
         # Sanitize sender and recipient names to prevent format string injection
         safe_sender = sanitize_format_string(sender)
         safe_rcpt = sanitize_format_string(rcpt)
@@ -2284,14 +2942,15 @@ class DeathBotProtocol(irc.IRCClient):
         # but first... deal with the "bonus" colours and leading @ symbols of discord users
         if user[0] == '@':
             plainuser = self.stripText(user).lower()
-            if not self.tellbuf.get(plainuser,None):
+            if not self.service.tellbuf.has(plainuser):
                 plainuser = plainuser[1:] # strip the leading @ and try again (below)
         else:
             plainuser = user.lower()
-        if not self.tellbuf.get(plainuser,None): return
+        if not self.service.tellbuf.has(plainuser): return
+        messages = self.service.tellbuf.take(plainuser)
         nicksfrom = []
-        if len(self.tellbuf[plainuser]) > 2 and user[0] != '@':
-            for (forwardto,sender,ts,message) in self.tellbuf[plainuser]:
+        if len(messages) > 2 and user[0] != '@':
+            for (forwardto,sender,ts,message) in messages:
                 if forwardto.lower() != user.lower(): # don't add sender to list if message was private
                     if sender not in nicksfrom: nicksfrom.append(sender)
                 self.respond(user,user, f"Message from {sender} at {self.msgTime(ts)}: {message}")
@@ -2309,10 +2968,8 @@ class DeathBotProtocol(irc.IRCClient):
                 self.respond(CHANNEL, user, "Messages from " + fromstr + " have been forwarded to you privately.");
 
         else:
-            for (forwardto,sender,ts,message) in self.tellbuf[plainuser]:
+            for (forwardto,sender,ts,message) in messages:
                 self.respond(forwardto, user, "Message from " + sender + " at " + self.msgTime(ts) + ": " + message)
-        del self.tellbuf[plainuser]
-        self.tellbuf.sync()
 
     QUERY_ID = 0 # just use a sequence number for now
     def newQueryId(self):
@@ -2342,6 +2999,7 @@ class DeathBotProtocol(irc.IRCClient):
         self.queries[q]["sender"] = sender
         self.queries[q]["resp"] = {}
         self.queries[q]["timestamp"] = time.time()
+        self.queries[q]["command"] = msgwords[0]
         message = "#Q# " + " ".join([q,sender] + msgwords)
 
         for sl in self.slaves:
@@ -2361,16 +3019,8 @@ class DeathBotProtocol(irc.IRCClient):
     # !players - respond to forwarded query and actually pull the info
     def getPlayers(self, master, sender, query, msgwords):
         plrvar_list = []
-        # Build a list of all ttyrec files with their associated variant
-        for var in self.inprog:
-            for inpdir in self.inprog[var]:
-                # Get all ttyrec files in this directory at once
-                ttyrec_files = glob.glob(inpdir + "*.ttyrec")
-                for inpfile in ttyrec_files:
-                    # /stuff/crap/PLAYER:shit:garbage.ttyrec
-                    # we want AFTER last '/', BEFORE 1st ':'
-                    player = inpfile.split("/")[-1].split(":")[0]
-                    plrvar_list.append(player + " " + self.displaytag(var))
+        for (player, var) in self.service.ingame.players():
+            plrvar_list.append(player + " " + self.displaytag(var))
         if not plrvar_list:
             plrvar = "No current players"
         else:
@@ -2399,46 +3049,25 @@ class DeathBotProtocol(irc.IRCClient):
                      + " Invalid player name.")
             return
 
-        target_player = player_name.lower()
-        # look for inrpogress file first, only report active games
-        for var in self.inprog:
-            # Check if player has an active game in this variant
-            player_found = False
-            for inpdir in self.inprog[var]:
-                ttyrec_pattern = f"{inpdir}{player_name}:*.ttyrec"
-                ttyrec_files = glob.glob(ttyrec_pattern)
-                if ttyrec_files:
-                    player_found = True
-                    break
-
-            if player_found:
-                # Look for whereis file
-                for widir in self.whereis[var]:
-                    whereis_file = f"{widir}{player_name}.whereis"
-                    # Try case-insensitive match
-                    whereis_files = glob.glob(whereis_file)
-                    if not whereis_files:
-                        # Try with different case
-                        whereis_pattern = f"{widir}*.whereis"
-                        for wipath in glob.glob(whereis_pattern):
-                            if wipath.split("/")[-1].lower() == (player_name + ".whereis").lower():
-                                whereis_files = [wipath]
-                                break
-
-                    if whereis_files:
-                        wipath = whereis_files[0]
-                        plr = wipath.split("/")[-1].split(".")[0] # Correct case
-                        with open(wipath, "rb") as f:
-                            wirec = parse_xlogfile_line(f.read(),":")
-
-                        self.msg(master, "#R# " + query
-                                 + f" {self.displaytag(SERVERTAG)} {plr}"
-                                 + f" {self.displaytag(var)}"
-                                 + f": ({wirec['role']} {wirec['race']} {wirec['gender']} {wirec['align']}) T:{wirec['turns']} "
-                                 + self.dungeons[var][wirec["dnum"]]
-                                 + f" level: {wirec['depth']}"
-                                 + ammy[wirec["amulet"]])
-                        return
+        # look for inprogress file first, only report active games
+        for var in self.service.ingame.variantsPlaying(player_name):
+            wipath = self.service.ingame.whereisFile(var, player_name)
+            if wipath:
+                plr = wipath.split("/")[-1].split(".")[0] # Correct case
+                try:
+                    with open(wipath, "rb") as f:
+                        wirec = parse_xlogfile_line(f.read(),":")
+                except OSError:
+                    continue # game ended since we last looked
+
+                self.msg(master, "#R# " + query
+                         + f" {self.displaytag(SERVERTAG)} {plr}"
+                         + f" {self.displaytag(var)}"
+                         + f": ({wirec['role']} {wirec['race']} {wirec['gender']} {wirec['align']}) T:{wirec['turns']} "
+                         + self.dungeons[var][wirec["dnum"]]
+                         + f" level: {wirec['depth']}"
+                         + ammy[wirec["amulet"]])
+                return
         self.msg(master, "#R# " + query + " " + self.displaytag(SERVERTAG)
                                         + f" {player_name}"
                                         + " is not currently playing on this server.")
@@ -2494,11 +3123,12 @@ class DeathBotProtocol(irc.IRCClient):
         plr = PLR.lower()
         stats = ""
         totasc = 0
+        asc = self.service.asc
         if var:
-            if not plr in self.asc[var]:
+            if not asc.hasAscended(var, plr):
                 repl = f"{self.displaytag(SERVERTAG)} No ascensions for {PLR} in "
-                if plr in self.allgames[var]:
-                    repl += f"{self.allgames[var][plr]} games of "
+                if asc.gameCount(var, plr):
+                    repl += f"{asc.gameCount(var, plr)} games of "
                 repl += self.variants[var][0][0] + "."
                 self.msg(master, f"#R# {query} {repl}")
                 return
@@ -2508,9 +3138,9 @@ class DeathBotProtocol(irc.IRCClient):
             role_stats = []
             for role in self.variants[var][1]:
                 role = role.title() # capitalise the first letter
-                if role in self.asc[var][plr]:
-                    totasc += self.asc[var][plr][role]
-                    role_stats.append(f"{self.asc[var][plr][role]}x{role}")
+                if asc.ascCount(var, plr, role):
+                    totasc += asc.ascCount(var, plr, role)
+                    role_stats.append(f"{asc.ascCount(var, plr, role)}x{role}")
             if role_stats:
                 stats_parts.append(" ".join(role_stats))
 
@@ -2518,24 +3148,24 @@ class DeathBotProtocol(irc.IRCClient):
             race_stats = []
             for race in self.variants[var][2]:
                 race = race.title()
-                if race in self.asc[var][plr]:
-                    race_stats.append(f"{self.asc[var][plr][race]}x{race}")
+                if asc.ascCount(var, plr, race):
+                    race_stats.append(f"{asc.ascCount(var, plr, race)}x{race}")
             if race_stats:
                 stats_parts.append(" ".join(race_stats))
 
             # Alignments
             align_stats = []
             for alig in self.aligns:
-                if alig in self.asc[var][plr]:
-                    align_stats.append(f"{self.asc[var][plr][alig]}x{alig}")
+                if asc.ascCount(var, plr, alig):
+                    align_stats.append(f"{asc.ascCount(var, plr, alig)}x{alig}")
             if align_stats:
                 stats_parts.append(" ".join(align_stats))
 
             # Genders
             gender_stats = []
             for gend in self.genders:
-                if gend in self.asc[var][plr]:
-                    gender_stats.append(f"{self.asc[var][plr][gend]}x{gend}")
+                if asc.ascCount(var, plr, gend):
+                    gender_stats.append(f"{asc.ascCount(var, plr, gend)}x{gend}")
             if gender_stats:
                 stats_parts.append(" ".join(gender_stats))
 
@@ -2544,21 +3174,21 @@ class DeathBotProtocol(irc.IRCClient):
                              + f" {PLR}"
                              + f" has ascended {self.variants[var][0][0]} "
                              + f"{totasc} times in "
-                             + f"{self.allgames[var][plr]}"
-                             + f" games ({(100.0 * totasc) / self.allgames[var][plr]:0.2f}%):"
+                             + f"{asc.gameCount(var, plr)}"
+                             + f" games ({(100.0 * totasc) / asc.gameCount(var, plr):0.2f}%):"
                              + stats)
             return
         # no variant. Do player stats across variants.
         totgames = 0
         variant_stats = []
-        for var in self.asc:
-            totgames += self.allgames[var].get(plr,0)
-            if plr in self.asc[var]:
-                varasc = self.asc[var][plr].get("Mal",0)
-                varasc += self.asc[var][plr].get("Fem",0)
-                varasc += self.asc[var][plr].get("Nbn",0)
+        for var in asc:
+            totgames += asc.gameCount(var, plr)
+            if asc.hasAscended(var, plr):
+                varasc = asc.ascCount(var, plr, "Mal")
+                varasc += asc.ascCount(var, plr, "Fem")
+                varasc += asc.ascCount(var, plr, "Nbn")
                 totasc += varasc
-                variant_stats.append(f"{self.displaystring[var]}: {varasc} ({(100.0 * varasc) / self.allgames[var][plr]:0.2f}%)")
+                variant_stats.append(f"{self.displaystring[var]}: {varasc} ({(100.0 * varasc) / asc.gameCount(var, plr):0.2f}%)")
         if totasc:
             stats = ", ".join(variant_stats)
             self.msg(master, f"#R# {query} "
@@ -2607,8 +3237,8 @@ class DeathBotProtocol(irc.IRCClient):
         plr = PLR.lower()
         reply = "#R# " + query + " "
         if var:
-            (lstart,lend,llength) = self.longstreak[var].get(plr,(0,0,0))
-            (cstart,cend,clength) = self.curstreak[var].get(plr,(0,0,0))
+            (lstart,lend,llength) = self.service.longstreak[var].get(plr,(0,0,0))
+            (cstart,cend,clength) = self.service.curstreak[var].get(plr,(0,0,0))
             if llength == 0:
                 reply = reply + "No streaks for " + PLR + self.displaytag(var) + "."
                 self.msg(master,reply)
@@ -2624,8 +3254,8 @@ class DeathBotProtocol(irc.IRCClient):
             return
         (lmax,cmax) = (0,0)
         for var in self.streakvars:
-            (lstart,lend,llength) = self.longstreak[var].get(plr,(0,0,0))
-            (cstart,cend,clength) = self.curstreak[var].get(plr,(0,0,0))
+            (lstart,lend,llength) = self.service.longstreak[var].get(plr,(0,0,0))
+            (cstart,cend,clength) = self.service.curstreak[var].get(plr,(0,0,0))
             if llength > lmax:
                 (lmax, lvar, lsmax, lemax)  = (llength, var, lstart, lend)
             if clength > cmax:
@@ -2644,54 +3274,61 @@ class DeathBotProtocol(irc.IRCClient):
         self.msg(master, reply)
 
     def getLastGame(self, master, sender, query, msgwords):
-        if (len(msgwords) >= 3): #var, plr, any order.
-            vp = self.varalias(msgwords[1])
-            pv = self.varalias(msgwords[2])
-            dl = self.lg.get(":".join([vp,pv]).lower(), False)
-            if not dl:
-                dl = self.lg.get(":".join([pv,vp]).lower(),False)
-            if not dl:
-                self.msg(master, "#R# " + query +
-                                 " No last game for (" + ",".join(msgwords[1:3]) + ").")
-                return
-            # TODO: Add timestamp to message so we can just output most recent across servers
-            self.msg(master, "#R# " + query + " " + self.displaytag(SERVERTAG) + " " + dl)
-            return
-        if (len(msgwords) == 2): #var OR plr - don't care which
-            vp = self.varalias(msgwords[1])
-            dl = self.lg.get(vp,False)
-            if not dl:
-                self.msg(master, "#R# " + query +
-                                 " No last game for " + msgwords[1] + ".")
-                return
-            self.msg(master, "#R# " + query + " " + self.displaytag(SERVERTAG) + " " + dl)
-            return
-        self.msg(master, "#R# " + query + " " + self.displaytag(SERVERTAG) + " " + self.lastgame)
+        self.replyLastGame(master, query, msgwords, self.service.lastgames, "game")
 
     def getLastAsc(self, master, sender, query, msgwords):
+        self.replyLastGame(master, query, msgwords, self.service.lastascs, "ascension")
+
+    def replyLastGame(self, master, query, msgwords, index, what):
+        # responses carry the game's endtime as "@<endtime>" so the master
+        # can pick the most recent across servers (see outLastGame)
         if (len(msgwords) >= 3): #var, plr, any order.
             vp = self.varalias(msgwords[1])
             pv = self.varalias(msgwords[2])
-            dl = self.la.get(":".join([pv,vp]).lower(),False)
-            if not dl:
-                dl = self.la.get(":".join([vp,pv]).lower(),False)
-            if not dl:
+            last = index.forPlayerVariant(vp, pv) or index.forPlayerVariant(pv, vp)
+            if not last:
                 self.msg(master, "#R# " + query +
-                                 " No last ascension for (" + ",".join(msgwords[1:3]) + ").")
+                                 f" No last {what} for (" + ",".join(msgwords[1:3]) + ").")
                 return
-            # TODO: Add timestamp to message so we can just output most recent across servers
-            self.msg(master, "#R# " + query + " " + self.displaytag(SERVERTAG) + " " + dl)
-            return
-        if (len(msgwords) == 2): #var OR plr - don't care which
+        elif (len(msgwords) == 2): #var OR plr - don't care which
             vp = self.varalias(msgwords[1])
-            dl = self.la.get(vp,False)
-            if not dl:
+            last = index.forVariant(vp) or index.forPlayer(vp)
+            if not last:
                 self.msg(master, "#R# " + query +
-                                 " No last ascension for " + msgwords[1] + ".")
+                                 f" No last {what} for " + msgwords[1] + ".")
                 return
-            self.msg(master, "#R# " + query + " " + self.displaytag(SERVERTAG) + " " + dl)
-            return
-        self.msg(master, "#R# " + query + " " + self.displaytag(SERVERTAG) + " " + self.lastasc)
+        else:
+            last = index.latest
+            if not last:
+                self.msg(master, "#R# " + query + f" No last {what} recorded.")
+                return
+        (endtime, dumplog, variant, player) = last
+        dumpurl = self.service.dumplogURL(dumplog, variant, player)
+        self.msg(master, "#R# " + query + f" @{endtime} " + self.displaytag(SERVERTAG) + " " + dumpurl)
+
+    # !lastgame/!lastasc callback. Output only the most recent game.
+    def outLastGame(self,q):
+        newest = (-1, "")
+        undated = []
+        fallback_msg = ""
+        for server in q["resp"]:
+            resp = q["resp"][server]
+            (stamp, _, rest) = resp.partition(" ")
+            if stamp.startswith("@") and stamp[1:].isdigit():
+                if int(stamp[1:]) > newest[0]:
+                    newest = (int(stamp[1:]), rest)
+            elif resp.split(' ')[0] == 'No':
+                fallback_msg = resp
+            else:
+                # a server that doesn't timestamp its responses
+                undated += [resp]
+        if newest[1]:
+            outmsg = newest[1]
+        elif undated:
+            outmsg = " :: ".join(undated)
+        else:
+            outmsg = fallback_msg
+        self.respond(q["replyto"],q["sender"],outmsg)
 
     # Allows players to set minimum turncount of their games to be reported
     # so they can manage their own deathspam
@@ -2711,8 +3348,7 @@ class DeathBotProtocol(irc.IRCClient):
                     self.msg(sender, "Cannot modify minimum turncount for " + sender.lower())
                     self.msg(master, "#R# " + query + " " + self.displaytag(SERVERTAG))
                     return
-                self.plr_tc[sender.lower()] = int(msgwords[1])
-                self.plr_tc.sync()
+                self.service.setMinTC(sender.lower(), int(msgwords[1]))
                 self.msg(master, "#R# " + query + " " + self.displaytag(SERVERTAG)
                                  + " Min reported turncount for " + sender.lower()
                                  + " set to " + msgwords[1])
@@ -2722,9 +3358,7 @@ class DeathBotProtocol(irc.IRCClient):
                 self.msg(sender, "Cannot modify minimum turncount for " + sender.lower())
                 self.msg(master, "#R# " + query + " " + self.displaytag(SERVERTAG))
                 return
-            if sender.lower() in self.plr_tc:
-                del self.plr_tc[sender.lower()]
-                self.plr_tc.sync()
+            if self.service.clearMinTC(sender.lower()):
                 self.msg(master, "#R# " + query + " " + self.displaytag(SERVERTAG)
                                  + " Min reported turncount for " + sender.lower()
                                  + " removed.")
@@ -2738,8 +3372,7 @@ class DeathBotProtocol(irc.IRCClient):
                         self.msg(sender, "Cannot modify minimum turncount for " + msgwords[1].lower())
                         self.msg(master, "#R# " + query + " " + self.displaytag(SERVERTAG))
                         return
-                    self.plr_tc[msgwords[1].lower()] = int(msgwords[2])
-                    self.plr_tc.sync()
+                    self.service.setMinTC(msgwords[1].lower(), int(msgwords[2]))
                     self.msg(master, "#R# " + query + " " + self.displaytag(SERVERTAG)
                                      + " Min reported turncount for " + msgwords[1].lower()
                                      + " set to " + msgwords[2])
@@ -2749,9 +3382,7 @@ class DeathBotProtocol(irc.IRCClient):
                     self.msg(sender, "Cannot modify minimum turncount for " + msgwords[1].lower())
                     self.msg(master, "#R# " + query + " " + self.displaytag(SERVERTAG))
                     return
-                if msgwords[1].lower() in self.plr_tc:
-                    del self.plr_tc[msgwords[1].lower()]
-                    self.plr_tc.sync()
+                if self.service.clearMinTC(msgwords[1].lower()):
                     self.msg(master, "#R# " + query + " " + self.displaytag(SERVERTAG)
                                      + " Min reported turncount for " + msgwords[1].lower()
                                      + " removed.")
@@ -2821,7 +3452,7 @@ class DeathBotProtocol(irc.IRCClient):
 
             # Internal bot commands (#q#, #r#) bypass all rate limiting
             if command.startswith('#') and command.endswith('#'):
-                self.commands[command](sender, replyto, msgwords)
+                self.runCommand(command, sender, replyto, msgwords)
                 return
 
             # Apply burst protection to user commands only (use host for rate limiting)
@@ -2835,17 +3466,25 @@ class DeathBotProtocol(irc.IRCClient):
                     return  # Silently ignore to prevent penalty message spam
 
                 # Provide specific error message based on penalty type (check host for penalty)
-                if hasattr(self, 'abuse_penalties') and sender_host in self.abuse_penalties:
-                    remaining = int(self.abuse_penalties[sender_host] - time.time())
+                remaining = self.ratelimiter.penaltyRemaining(sender_host)
+                if remaining is not None:
+                    remaining = int(remaining)
                     self.respond(replyto, sender, f"Abuse penalty active: {remaining//60}m {remaining%60}s remaining. (Triggered by spamming consecutive commands)")
                 else:
                     self.respond(replyto, sender, f"Rate limit exceeded. Please wait before using !{command} again.")
                 return
 
-            self.commands[command](sender, replyto, msgwords)
+            self.runCommand(command, sender, replyto, msgwords)
             return
         if dest != CHANNEL and sender in self.slaves: # game announcement from slave
-            self.msgLog(CHANNEL, " ".join(msgwords))
+            self.msgLog(CHANNEL, " ".join(msgwords), priority=OutboundQueue.ANNOUNCE)
+
+    # Run a command handler, timing it for !status and !slow
+    def runCommand(self, command, sender, replyto, msgwords):
+        start = time.perf_counter()
+        self.commands[command](sender, replyto, msgwords)
+        if command == "#q#": command = " ".join(msgwords[0:1] + msgwords[3:4])
+        self.service.perf.record("cmd", command, time.perf_counter() - start)
 
     #other events for logging
     def action(self, doer, dest, message):
@@ -2894,134 +3533,439 @@ class DeathBotProtocol(irc.IRCClient):
         user = user.split('!')[0]
         self.log("-!- " + user + " changed the topic on " + channel + " to: " + newTopic)
 
+    def connectionLost(self, reason=None):
+        (unsent, dropped) = self.outq.clear()
+        if dropped: tlog(f"Dropped {dropped} unsent lines")
+        if self.looping_calls is None: return
+        for call in self.looping_calls.values():
+            call.stop()
+        # announcements still queued go back to the service, to be made
+        # once we reconnect (e.g. after an excess flood kill)
+        if unsent: tlog(f"Requeued {len(unsent)} unsent announcements")
+        self.service.pending.extend(unsent)
+        # the service keeps tracking games; it just stops talking to us
+        self.service.detach(self)
+
+    # Send a game announcement from the service to wherever it should go
+    def announce(self, line, variant):
+        origin = (line, variant)
+        if not line.startswith(("http://", "https://")):
+            line = self.displaytag(SERVERTAG) + " " + line
+        if SLAVE:
+            for master in MASTERS:
+                self.msg(master, line, priority=OutboundQueue.ANNOUNCE, origin=origin)
+        else:
+            self.msgLog(CHANNEL, line, priority=OutboundQueue.ANNOUNCE, origin=origin)
+        for fwd in self.forwards[variant]:
+            self.msg(fwd, line, priority=OutboundQueue.FORWARD)
+
+class DeathBotService(service.Service):
+    """Game tracking state that outlives any one IRC connection.
+
+    The factory owns a single instance of this. It replays the xlogfiles,
+    polls the logs and keeps the stats and the !tell/!setmintc stores.
+    Each new DeathBotProtocol attaches to it after signing on, so a
+    reconnect costs nothing beyond the IRC handshake.
+    """
+    # variant tables live on the protocol; share them here
+    xlogfiles = DeathBotProtocol.xlogfiles
+    livelogs = DeathBotProtocol.livelogs
+    variants = DeathBotProtocol.variants
+    streakvars = DeathBotProtocol.streakvars
+    displaystring = DeathBotProtocol.displaystring
+    DGLD = DeathBotProtocol.DGLD
+    inprogPatterns = DeathBotProtocol.inprogPatterns
+    whereisPatterns = DeathBotProtocol.whereisPatterns
+
+    # dumplogs live in {root}/{name[0]}/{name}/{dumpfmt}
+    dump_url_root = WEBROOT + "userdata/"
+    dump_file_root = FILEROOT + "dgldir/userdata/"
+    # and are archived to S3 after a while; where depends on the server
+    dump_s3_root = {"hdf-us": "https://hdf-us.s3.amazonaws.com/dumplogs/",
+                    "hdf-eu": "https://hdf-eu.s3.amazonaws.com/dumplogs/",
+                    "hdf-au": "https://hdf-au.s3.amazonaws.com/dumplogs/"}.get(SERVERTAG)
+
+    def __init__(self):
+        self.bot = None  # currently attached DeathBotProtocol, if any
+        # announcements made while we have no IRC connection
+        self.pending = collections.deque(maxlen=MAX_PENDING_ANNOUNCEMENTS)
+        # (variant, kind) -> announcements from this reactor tick (DIGEST_THRESHOLD)
+        self.digest = {}
+        self.looping_calls = {}
+        self.ingame = InProgressIndex(self.DGLD, self.inprogPatterns,
+                                      FILEROOT, self.whereisPatterns)
+        self.perf = PerfStats()
+        self.http = HttpFetcher()
+        self.dumplogs = DumplogLocator()
+
+    def startService(self):
+        service.Service.startService(self)
+        # Track bot start time for uptime calculation
+        self.starttime = time.time()
+
+        self._initializeLogs()
+        self._initializeStats()
+        self._initializeDatabases()
+        coldstart = not self._loadStatsSnapshot()
+        self._seekToEndOfLivelogs()
+        if coldstart and REPLAY_WORKERS > 1:
+            self._populateHistoricalDataParallel()
+        else:
+            self._populateHistoricalData()
+        self._startMonitoringTasks()
+
+    def stopService(self):
+        service.Service.stopService(self)
+        self.watcher.stop()
+        self.ingame.stop()
+        for tailer in self.tailers.values():
+            tailer.close()
+        for call in self.looping_calls.values():
+            if call.running: call.stop()
+        self.http.stop()
+        if not SLAVE: DeathBotProtocol.chanLog.flush()
+        self._saveStatsSnapshot()
+        # Close the databases
+        self.tellbuf.close()
+        self.plr_tc.close()
+        self.rumors.db.close()
+
+    # A protocol attaches once signed on, and detaches when the connection drops
+    def attach(self, bot):
+        self.bot = bot
+        while self.pending:
+            bot.announce(*self.pending.popleft())
+
+    def detach(self, bot):
+        if self.bot is bot:
+            self.bot = None
+
+    def announce(self, line, variant):
+        if self.bot is None:
+            self.pending.append((line, variant))
+        else:
+            self.bot.announce(line, variant)
+
+    def _initializeLogs(self):
+        """Initialize log file tracking"""
+        self.logs = {}
+        for xlogfile, (variant, delim, dumpfmt) in self.xlogfiles.items():
+            dumplogs = DumplogTemplate(dumpfmt, self.dump_file_root,
+                                       self.dump_url_root, self.dump_s3_root)
+            self.logs[xlogfile] = (self.xlogfileReport, variant, delim, dumplogs)
+            self.dumplogs.templates[variant] = dumplogs
+        for livelog, (variant, delim) in self.livelogs.items():
+            self.logs[livelog] = (self.livelogReport, variant, delim, "")
+
+        self.logs_seek = {}
+
+    def _initializeStats(self):
+        """Initialize everything built up from the xlogfiles"""
+        self._initializeGameTracking()
+        self._initializeStreaks()
+        self._initializeAscensions()
+
+    def _initializeGameTracking(self):
+        """Initialize last game tracking"""
+        self.lastgames = LastGameIndex()
+        self.lastascs = LastGameIndex()
+
+    def _initializeStreaks(self):
+        """Initialize streak tracking"""
+        self.curstreak = {}
+        self.longstreak = {}
+        for v in self.streakvars:
+            # curstreak[var][player] = (start, end, length)
+            self.curstreak[v] = {}
+            # longstreak - as above
+            self.longstreak[v] = {}
+
+    def _initializeAscensions(self):
+        """Initialize ascension tracking"""
+        # ascensions (for !asc)
+        # "!asc plr var" will give something like Rodney's output.
+        # "!asc plr" will give breakdown by variant.
+        # "!asc" or "!asc var" will be as above, assuming requestor's nick.
+        # counts ascensions per player as role, race, align and gender;
+        # assumes 3-char abbreviations for role/race/align/gender, and no overlaps.
+        # for asc ratio we need total games too
+        self.asc = AscStore(self.variants)
+
+    def _initializeDatabases(self):
+        """Initialize the !tell store and shelve databases"""
+        # for !tell (migrating from the shelve it used to live in)
+        self.tellbuf = TellStore(BOTDIR + "/tellmsg.sqlite",
+                                 legacy=(BOTDIR + "/tellmsg.db", BOTDIR + "/tellmsg"))
+
+        # for !setmintc
+        try:
+            self.plr_tc = shelve.open(BOTDIR + "/plrtc.db", writeback=False)
+        except (OSError, IOError):
+            self.plr_tc = shelve.open(BOTDIR + "/plrtc", writeback=False, protocol=2)
+        # what plr_tc_notreached reads: the shelve, overridden by PERMANENT_MINTC
+        self.mintc = dict(self.plr_tc)
+        self.mintc.update(PERMANENT_MINTC)
+
+        # for !rumor
+        try:
+            rumordb = shelve.open(BOTDIR + "/rumors.db", writeback=False)
+        except (OSError, IOError):
+            rumordb = shelve.open(BOTDIR + "/rumors", writeback=False, protocol=2)
+        self.rumors = RumorCache(self.http, rumordb)
+
+
+    def _seekToEndOfLivelogs(self):
+        """Seek to end of livelog files"""
+
+        # seek to end of livelogs
+        for filepath in self.livelogs:
+            with filepath.open("r") as handle:
+                handle.seek(0, 2)
+                self.logs_seek[filepath] = handle.tell()
+
+    # Statistics snapshot.
+    # Replaying every xlogfile from byte zero takes minutes on a busy server,
+    # so the aggregated stats are checkpointed along with the xlogfile offsets
+    # they were built from. At startup we load the checkpoint and only replay
+    # whatever was appended since.
+    statsSnapshotName = BOTDIR + "/stats.pickle"
+    statsSnapshotAttrs = ("asc", "curstreak", "longstreak",
+                          "lastgames", "lastascs")
+
+    def _saveStatsSnapshot(self):
+        """Write aggregated stats and xlogfile offsets to disk"""
+        try:
+            files = {}
+            for filepath in self.xlogfiles:
+                if filepath not in self.logs_seek: continue
+                try:
+                    inode = os.stat(filepath.path).st_ino
+                except OSError:
+                    continue
+                files[filepath.path] = (inode, self.logs_seek[filepath])
+            snapshot = {"version": STATS_SNAPSHOT_VERSION, "files": files}
+            for attr in self.statsSnapshotAttrs:
+                snapshot[attr] = getattr(self, attr)
+            # write to a temporary file and rename, so a crash mid-write
+            # never leaves us with a truncated snapshot
+            tmpname = self.statsSnapshotName + ".tmp"
+            with open(tmpname, "wb") as f:
+                pickle.dump(snapshot, f, protocol=pickle.HIGHEST_PROTOCOL)
+            os.replace(tmpname, self.statsSnapshotName)
+        except (OSError, IOError, pickle.PicklingError) as e:
+            tlog(f"Error saving stats snapshot: {e}")
+
+    def _loadStatsSnapshot(self):
+        """Restore aggregated stats and xlogfile offsets from disk.
+        Returns True if the snapshot was usable, False if we need a full replay.
+        """
+        try:
+            with open(self.statsSnapshotName, "rb") as f:
+                snapshot = pickle.load(f)
+        except FileNotFoundError:
+            return False
+        except Exception as e:
+            tlog(f"Ignoring unreadable stats snapshot: {e}")
+            return False
+        if snapshot.get("version") != STATS_SNAPSHOT_VERSION:
+            tlog("Ignoring stats snapshot from a different version")
+            return False
+        seek = {}
+        for filepath in self.xlogfiles:
+            if filepath.path not in snapshot["files"]:
+                continue # new xlogfile since the snapshot, replay it from the start
+            (inode, offset) = snapshot["files"][filepath.path]
+            try:
+                st = os.stat(filepath.path)
+            except OSError:
+                continue
+            if st.st_ino != inode or st.st_size < offset:
+                # the file was replaced or truncated under us, so the
+                # snapshot no longer describes it. Start from scratch.
+                tlog(f"Stats snapshot is stale for {filepath.path}, doing full replay")
+                return False
+            seek[filepath] = offset
+        for attr in self.statsSnapshotAttrs:
+            setattr(self, attr, snapshot[attr])
+        self.logs_seek.update(seek)
+        tlog(f"Loaded stats snapshot covering {len(seek)} xlogfiles")
+        return True
+
+    def _populateHistoricalData(self):
+        """Read xlogfiles to populate historical game data"""
+        # sequentially read xlogfiles to pre-populate lastgame data, starting
+        # where the stats snapshot (if any) left off.
+        for filepath in self.xlogfiles:
+            self._replayXlogfile(filepath)
+
+    def _replayXlogfile(self, filepath):
+        """Gather stats from one xlogfile without announcing anything"""
+        offset = self.logs_seek.get(filepath, 0)
+        with filepath.open("r") as handle:
+            handle.seek(offset)
+            for line in handle:
+                if not line.endswith(b"\n"):
+                    break # still being written; the tailer picks it up later
+                offset += len(line)
+                delim = self.logs[filepath][2]
+                game = parse_xlogfile_line(line, delim)
+                game.variant = self.logs[filepath][1]
+                if game.variant == "fh":
+                    game.dumplog = fixdump(game.dumplog)
+                if game.variant == "nh4":
+                    game.dumplog = fixdump(game.dumplog)
+                game.dumplogs = self.logs[filepath][3]
+                for line in self.logs[filepath][0](game,False):
+                    pass
+        self.logs_seek[filepath] = offset
+
+    def _populateHistoricalDataParallel(self):
+        """Replay each variant's xlogfiles in its own worker process.
+        The xlogfiles are independent, so on a multi-core box a cold start
+        takes as long as the biggest one rather than all of them together.
+        """
+        byvariant = {}
+        for filepath, (variant, delim, dumpfmt) in self.xlogfiles.items():
+            byvariant.setdefault(variant, []).append(filepath)
+        tlog(f"Replaying {len(self.xlogfiles)} xlogfiles with {REPLAY_WORKERS} workers")
+        # fork, so workers inherit the loaded config rather than re-running
+        # this script. We haven't started the reactor yet, so this is safe.
+        context = multiprocessing.get_context("fork")
+        with concurrent.futures.ProcessPoolExecutor(REPLAY_WORKERS, mp_context=context) as pool:
+            jobs = [(pool.submit(replayXlogfiles, [fp.path for fp in filepaths]), filepaths)
+                    for filepaths in byvariant.values()]
+            # merge in xlogfiles order, so ties between equal endtimes
+            # resolve the same way as a sequential replay
+            for (job, filepaths) in jobs:
+                try:
+                    self._mergeReplay(job.result())
+                except Exception as e:
+                    tlog(f"Parallel replay failed for {filepaths[0].path}, replaying here: {e}")
+                    for filepath in filepaths:
+                        self._replayXlogfile(filepath)
+
+    def _mergeReplay(self, result):
+        """Fold one worker's stats (see replayXlogfiles) into ours"""
+        # per-variant stats belong to exactly one worker
+        for var in result["variants"]:
+            self.asc.replaceVariant(result["asc"], var)
+            if var in self.streakvars:
+                self.curstreak[var] = result["curstreak"][var]
+                self.longstreak[var] = result["longstreak"][var]
+        self.lastgames.merge(result["lastgames"])
+        self.lastascs.merge(result["lastascs"])
+        for filepath in self.xlogfiles:
+            if filepath.path in result["seek"]:
+                self.logs_seek[filepath] = result["seek"][filepath.path]
+
+    def _startMonitoringTasks(self):
+        """Start log watching and periodic housekeeping"""
+        # keep every log open, picking up where startup left off
+        self.tailers = {}
+        for filepath in self.logs:
+            self.tailers[filepath] = LogTailer(filepath, self.logs_seek.get(filepath, 0))
+
+        # keep track of games in progress for !players and !whereis
+        self.ingame.start()
+
+        # report on logs as soon as they are written to
+        self.watcher = LogWatcher(self.logReport)
+        self.watcher.start(self.logs)
+
+        # Expire old !tell messages (every hour)
+        self.looping_calls["expire"] = task.LoopingCall(self.expireMessages)
+        self.looping_calls["expire"].start(3600)
+
+        # Checkpoint the stats so a restart doesn't replay every xlogfile
+        self.looping_calls["snapshot"] = task.LoopingCall(self._saveStatsSnapshot)
+        self.looping_calls["snapshot"].start(STATS_SNAPSHOT_INTERVAL, now=False)
+
+        # Measure how late the reactor gets round to things
+        self.looping_calls["lag"] = task.LoopingCall(self.perf.tick)
+        self.looping_calls["lag"].start(PERF_LAG_INTERVAL)
+
+    def expireMessages(self):
+        """Clean up undelivered !tell messages older than 180 days"""
+        try:
+            removed = self.tellbuf.expire(time.time() - 180 * 24 * 3600)
+            if removed:
+                tlog(f"Cleaned up {removed} old messages")
+        except Exception as e:
+            tlog(f"Error cleaning up tellbuf: {e}")
+
     ### Xlog/livelog event processing
     def startscummed(self, game):
-        return game["death"] in ("quit", "escaped") and game["points"] < 1000
+        return game.death in ("quit", "escaped") and game.points < 1000
 
     # players can request their deaths and other events not be reported if less than x turns
     def plr_tc_notreached(self, name, turns):
-        lname = name.lower()
-        if lname in PERMANENT_MINTC:
-            return turns < PERMANENT_MINTC[lname]
-        return (lname in self.plr_tc
-           and turns < self.plr_tc[lname])
-
-    def generate_dumplog_url(self, game, dumpfile):
-        """Generate dumplog URL, checking local storage first, then S3.
+        mintc = self.mintc.get(name.lower())
+        return mintc is not None and turns < mintc
+
+    # !setmintc changes go to memory and straight through to the shelve
+    def setMinTC(self, lname, turns):
+        self.mintc[lname] = self.plr_tc[lname] = turns
+        self.plr_tc.sync()
+
+    def clearMinTC(self, lname):
+        """Remove lname's min turncount; False if there wasn't one"""
+        if lname not in self.mintc: return False
+        del self.mintc[lname]
+        del self.plr_tc[lname]
+        self.plr_tc.sync()
+        return True
 
-        Returns the URL if file exists in either location, None otherwise.
-        """
-        # First check if file exists locally
-        if os.path.exists(dumpfile):
-            # File exists locally, use regular URL
-            # Format the dumpfmt template with game data
-            formatted_dumpfmt = game["dumpfmt"].format(**game)
-            dumpurl = urllib.parse.quote(formatted_dumpfmt)
-            # Format the URL prefix template with game data
-            formatted_prefix = self.dump_url_prefix.format(**game)
-            return f"{formatted_prefix}{dumpurl}"
-
-        # File doesn't exist locally - generate S3 URL
-        # S3 URL structure differs by server
-        s3_base = None
-        if SERVERTAG == "hdf-us":
-            s3_base = "https://hdf-us.s3.amazonaws.com/dumplogs/"
-        elif SERVERTAG == "hdf-eu":
-            s3_base = "https://hdf-eu.s3.amazonaws.com/dumplogs/"
-        elif SERVERTAG == "hdf-au":
-            s3_base = "https://hdf-au.s3.amazonaws.com/dumplogs/"
-
-        if s3_base:
-            # Generate S3 URL
-            # Format the dumpfmt template with game data
-            formatted_dumpfmt = game["dumpfmt"].format(**game)
-            dumppath = urllib.parse.quote(formatted_dumpfmt)
-            # S3 path structure: dumplogs/{name[0]}/{name}/{variant}/dumplog/{filename}
-            s3_url = f"{s3_base}{game['name'][0]}/{game['name']}/{dumppath}"
-            return s3_url
-
-        # If we can't determine S3 location, return None
-        return None
+    def dumplogURL(self, dumplog, variant, name):
+        """URL to give out for a dumplog from DumplogTemplate.key"""
+        return (self.dumplogs.url(variant, name, dumplog)
+                or f"(sorry, no dump exists for {variant}:{name})")
 
     def xlogfileReport(self, game, report = True):
         # Check if the game is in explore mode (flags & 0x2) and skip if so
-        if "flags" in game and game["flags"] & 0x2:
+        if getattr(game, "flags", 0) & 0x2:
             return  # Don't report explore mode games
 
         # Check if this is a TNNT game outside tournament period (Nov 1-Dec 1 UTC)
-        if game["variant"] == "tnnt":
+        if game.variant == "tnnt":
             current_month = datetime.datetime.now(datetime.UTC).month
             if current_month != 11:
                 return  # Don't report TNNT games outside November
 
-        var = game["variant"] # Make code less ugly
+        var = game.variant # Make code less ugly
         # lowercased name is used for lookups
-        lname = game["name"].lower()
-        # "allgames" for a player even counts scummed games
-        if not lname in self.allgames[var]:
-            self.allgames[var][lname] = 0
-        self.allgames[var][lname] += 1
+        lname = game.name.lower()
+        # games played for a player even counts scummed games
+        self.asc.addGame(var, lname)
 
-        dumplog = game.get("dumplog",False)
+        dumplog = getattr(game, "dumplog", False)
         if dumplog and var != "dyn":
-            game["dumplog"] = fixdump(dumplog)
-        # Need to figure out the dump path before messing with the name below
-        # Format the dump file path template with game data
-        dumpfile_template = self.dump_file_prefix + game["dumpfmt"]
-        dumpfile = dumpfile_template.format(**game)
-
-        # Generate dumplog URL using new method that checks both local and S3
-        if TEST:
-            # In test mode, always generate a URL
-            # Format the dumpfmt template with game data
-            formatted_dumpfmt = game["dumpfmt"].format(**game)
-            dumpurl = urllib.parse.quote(formatted_dumpfmt)
-            # Format the URL prefix template with game data
-            formatted_prefix = self.dump_url_prefix.format(**game)
-            dumpurl = f"{formatted_prefix}{dumpurl}"
-        else:
-            # In production, check both local and S3 locations
-            generated_url = self.generate_dumplog_url(game, dumpfile)
-            if generated_url:
-                dumpurl = generated_url
-            else:
-                dumpurl = f"(sorry, no dump exists for {game['variant']}:{game['name']})"
+            game.dumplog = fixdump(dumplog)
+        # Need to figure out the dump path before messing with the name below.
+        # Whether it's still on local storage is only checked when we hand
+        # out the URL, so replaying old games at startup doesn't stat them all.
+        dumplog = game.dumplogs.key(game)
         # Kludge for nethack 1.3d -
         # populate race and align with dummy values.
-        if "race" not in game: game["race"] = "###"
-        if "align" not in game: game["align"] = "###"
+        if not hasattr(game, "race"): game.race = "###"
+        if not hasattr(game, "align"): game.align = "###"
 
-        if game["death"][0:8] in ("ascended"):
+        if game.death[0:8] in ("ascended"):
             # no suffix on ascension line - URL sent separately
-            game["ascsuff"] = ""
-            game["asc_dumpurl"] = dumpurl
+            game.ascsuff = ""
+            if report:
+                game.asc_dumpurl = self.dumplogURL(dumplog, var, game.name)
             # !lastasc stats.
-            self.la[f"{game['variant']}:{game['name']}".lower()] = dumpurl
-            if (game["endtime"] > self.lae.get(lname, 0)):
-                self.lae[lname] = game["endtime"]
-                self.la[lname] = dumpurl
-            self.la[var] = dumpurl
-            if (game["endtime"] > self.tlastasc):
-                self.lastasc = dumpurl
-                self.tlastasc = game["endtime"]
+            self.lastascs.add(game.endtime, dumplog, var, game.name)
 
             # !asc stats
-            if not lname in self.asc[var]: self.asc[var][lname] = {}
-            if not game["role"]   in self.asc[var][lname]: self.asc[var][lname][game["role"]]   = 0
-            if not game["race"]   in self.asc[var][lname]: self.asc[var][lname][game["race"]]   = 0
-            if not game["gender"] in self.asc[var][lname]: self.asc[var][lname][game["gender"]] = 0
-            if not game["align"]  in self.asc[var][lname]: self.asc[var][lname][game["align"]]  = 0
-            self.asc[var][lname][game["role"]]   += 1
-            self.asc[var][lname][game["race"]]   += 1
-            self.asc[var][lname][game["gender"]] += 1
-            self.asc[var][lname][game["align"]]  += 1
+            self.asc.addAscension(var, lname, (game.role, game.race, game.gender, game.align))
 
             # streaks
             if var in self.streakvars:
                 (cs_start, cs_end,
                  cs_length) = self.curstreak[var].get(lname,
-                                                      (game["starttime"],0,0))
-                cs_end = game["endtime"]
+                                                      (game.starttime,0,0))
+                cs_end = game.endtime
                 cs_length += 1
                 self.curstreak[var][lname] = (cs_start, cs_end, cs_length)
                 (ls_start, ls_end,
@@ -3030,25 +3974,19 @@ class DeathBotProtocol(irc.IRCClient):
                     self.longstreak[var][lname] = self.curstreak[var][lname]
 
         else:   # not ascended - kill off any streak
-            game["ascsuff"] = ""
+            game.ascsuff = ""
             if var in self.streakvars:
                 if lname in self.curstreak[var]:
                     del self.curstreak[var][lname]
-            if self.plr_tc_notreached(game["name"], game["turns"]): report = False # ignore due to !setmintc, only if not ascended
+            if report and self.plr_tc_notreached(game.name, game.turns): report = False # ignore due to !setmintc, only if not ascended
 
         if self.startscummed(game): return
         # only populate "!lastgame" fields for non-scummed games
-        self.lg[f"{game['variant']}:{game['name']}".lower()] = dumpurl
-        if (game["endtime"] > self.lge.get(lname, 0)):
-            self.lge[lname] = game["endtime"]
-            self.lg[lname] = dumpurl
-        self.lg[var] = dumpurl
-        if (game["endtime"] > self.tlastgame):
-            self.lastgame = dumpurl
-            self.tlastgame = game["endtime"]
+        self.lastgames.add(game.endtime, dumplog, var, game.name)
 
         # end of statistics gathering
         if (not report): return # we're just reading through old entries at startup
+        game = game.asdict() # plain dict from here on, for the announcement
 
         # format duration string based on realtime and/or wallclock duration
         if "starttime" in game and "endtime" in game:
@@ -3184,40 +4122,90 @@ class DeathBotProtocol(irc.IRCClient):
             yield (f"[{event['displaystring']}] {event['player']} ({event['role']} {event['race']} {event['gender']} {event['align']}) "
                    f"killed {event['killed_shopkeeper']} on T:{event['turns']}")
 
-    def connectionLost(self, reason=None):
-        if self.looping_calls is None: return
-        for call in self.looping_calls.values():
-            call.stop()
-        # Clean up shelve databases
-        if hasattr(self, 'tellbuf') and self.tellbuf is not None:
-            self.tellbuf.close()
-        if hasattr(self, 'plr_tc') and self.plr_tc is not None:
-            self.plr_tc.close()
 
     def logReport(self, filepath):
-        with filepath.open("r") as handle:
-            handle.seek(self.logs_seek[filepath])
-
-            for line in handle:
-                delim = self.logs[filepath][2]
-                game = parse_xlogfile_line(line, delim)
-                game["variant"] = self.logs[filepath][1]
-                game["displaystring"] = self.displaystring.get(game["variant"],game["variant"])
-                game["dumpfmt"] = self.logs[filepath][3]
-                for line in self.logs[filepath][0](game):
-                    if not line.startswith(("http://", "https://")):
-                        line = self.displaytag(SERVERTAG) + " " + line
-                    if SLAVE:
-                        for master in MASTERS:
-                            self.msg(master, line)
-                    else:
-                        self.msgLog(CHANNEL, line)
-                    for fwd in self.forwards[game["variant"]]:
-                        self.msg(fwd, line)
-
-            self.logs_seek[filepath] = handle.tell()
+        start = time.perf_counter()
+        tailer = self.tailers[filepath]
+        for line in tailer.readLines():
+            delim = self.logs[filepath][2]
+            game = parse_xlogfile_line(line, delim)
+            game.variant = self.logs[filepath][1]
+            game.displaystring = self.displaystring.get(game.variant, game.variant)
+            game.dumplogs = self.logs[filepath][3]
+            lines = list(self.logs[filepath][0](game))
+            # ascensions, with their dumplog URL, are always announced in full
+            if DIGEST_THRESHOLD and lines and "asc_dumpurl" not in game:
+                kind = "deaths" if self.logs[filepath][0] == self.xlogfileReport else "events"
+                self.digestAnnounce(lines[0], game.variant, kind)
+                continue
+            if DIGEST_THRESHOLD:
+                # don't let it overtake what this variant has on hold
+                self.flushDigest(game.variant)
+            for line in lines:
+                self.announce(line, game.variant)
+        self.logs_seek[filepath] = tailer.offset
+        self.perf.record("log", filepath.path, time.perf_counter() - start)
+
+    # Digest mode: with DIGEST_THRESHOLD set, a variant's announcements are
+    # held until the end of the reactor tick. More than DIGEST_THRESHOLD of
+    # one kind get merged into "5 deaths in [nh370]: ..." lines. An ascension
+    # is announced in full, after whatever its variant already has on hold.
+    def digestAnnounce(self, line, variant, kind):
+        if not self.digest:
+            reactor.callLater(0, self.flushDigest)
+        self.digest.setdefault((variant, kind), []).append(line)
+
+    def flushDigest(self, only=None):
+        if only is None:
+            digest, self.digest = self.digest, {}
+        else:
+            digest = {key: self.digest.pop(key) for key in list(self.digest)
+                      if key[0] == only}
+        for (variant, kind), lines in digest.items():
+            if len(lines) <= DIGEST_THRESHOLD:
+                for line in lines:
+                    self.announce(line, variant)
+                continue
+            tag = "[" + self.displaystring.get(variant, variant) + "] "
+            # "[nh370] zed (Val Hum Fem Law), 123 points, ..." -> "zed, 123 points, ..."
+            items = [RE_DIGEST_ROLE.sub("", line.removeprefix(tag), count=1) for line in lines]
+            head = f"{len(lines)} {kind} in {tag[:-1]}: "
+            summary = []
+            for item in items:
+                # keep each line well inside the IRC limit, as splitMessage does
+                if summary and len(head + " | ".join(summary + [item])) > 350:
+                    self.announce(head + " | ".join(summary), variant)
+                    head, summary = tag + "... ", []
+                # an item too long for a line of its own goes out in pieces
+                while len(head + item) > 350:
+                    cut = item.rfind(" ", 0, 350 - len(head))
+                    if cut <= 0: cut = 350 - len(head)
+                    self.announce(head + item[:cut], variant)
+                    head, item = tag + "... ", item[cut:].lstrip()
+                summary.append(item)
+            self.announce(head + " | ".join(summary), variant)
+
+def replayXlogfiles(paths):
+    """Process pool worker for DeathBotService._populateHistoricalDataParallel.
+    Replays the given xlogfiles into a fresh service and returns its stats.
+    """
+    worker = DeathBotService()
+    worker._initializeLogs()
+    worker._initializeStats()
+    filepaths = [fp for fp in worker.xlogfiles if fp.path in paths]
+    for filepath in filepaths:
+        worker._replayXlogfile(filepath)
+    result = {attr: getattr(worker, attr) for attr in worker.statsSnapshotAttrs}
+    result["variants"] = [worker.xlogfiles[fp][0] for fp in filepaths]
+    result["seek"] = {fp.path: worker.logs_seek[fp] for fp in filepaths}
+    return result
 
 class DeathBotFactory(ReconnectingClientFactory):
+    def __init__(self):
+        # one game tracking service for the life of the process,
+        # shared by every protocol instance we build on reconnect
+        self.service = DeathBotService()
+
     def startedConnecting(self, connector):
         tlog('Started to connect.')
 
@@ -3253,6 +4241,10 @@ if __name__ == '__main__':
     # create factory protocol and application
     f = DeathBotFactory()
 
+    # replay the xlogfiles and start watching the logs before we connect
+    f.service.startService()
+    reactor.addSystemEventTrigger('before', 'shutdown', f.service.stopService)
+
     # connect factory to this host and port
     reactor.connectSSL(HOST, PORT, f, ssl.ClientContextFactory())
 
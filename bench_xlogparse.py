@@ -0,0 +1,78 @@
+#!/usr/bin/env python3
+"""Micro-benchmark for parse_xlogfile_line.
+
+Compares the old parser (a dict per line, every field converted) with the
+current GameRecord one, on the access pattern of a startup replay: parse
+the line and read the fields xlogfileReport looks at.
+
+    python bench_xlogparse.py [xlogfile] [delimiter]
+
+Without arguments a synthetic 3.7-style xlogfile line is used.
+"""
+import sys
+import timeit
+
+import test_botconf
+sys.modules.setdefault("botconf", test_botconf)
+import beholder
+
+SAMPLE = "\t".join([
+    "version=3.7.0", "points=12345", "deathdnum=0", "deathlev=12", "maxlvl=14",
+    "hp=-3", "maxhp=87", "deaths=1", "deathdate=20240101", "birthdate=20231231",
+    "uid=5", "role=Val", "race=Hum", "gender=Fem", "align=Neu", "name=somebody",
+    "death=killed by a soldier ant", "conduct=0x180", "turns=23456",
+    "achieve=0x40", "realtime=12345", "starttime=1704000000", "endtime=1704100000",
+    "gender0=Fem", "align0=Neu", "flags=0x4", "gold=1234", "wish_cnt=1",
+    "arti_wish_cnt=0", "bones=0", "while=fainted from lack of food",
+    "dumplog=nh370_dumplog/somebody.txt", "conductX=polyselfless,atheist",
+    "achieveX=entered_the_gnomish_mines,entered_mine_town",
+]).encode() + b"\n"
+
+def legacy_parse_xlogfile_line(line, delim):
+    """parse_xlogfile_line as it was before the lazy parser"""
+    record = {}
+    for field in line.strip().decode(encoding='UTF-8', errors='ignore').split(delim):
+        key, _, value = field.partition("=")
+        if key in beholder.xlogfile_parse:
+            value = beholder.xlogfile_parse[key](value)
+        elif key in beholder.xlogfile_user_fields:
+            value = beholder.sanitize_format_string(value)
+        record[key] = value
+    return record
+
+def replay_dicts(lines, delim):
+    for line in lines:
+        game = legacy_parse_xlogfile_line(line, delim)
+        if "flags" in game and game["flags"] & 0x2:
+            continue
+        game["name"].lower()
+        game.get("dumplog", False)
+        game["death"], game["points"], game["turns"], game["endtime"]
+        game["role"], game["race"], game["gender"], game["align"]
+
+def replay_records(lines, delim):
+    for line in lines:
+        game = beholder.parse_xlogfile_line(line, delim)
+        if getattr(game, "flags", 0) & 0x2:
+            continue
+        game.name.lower()
+        getattr(game, "dumplog", False)
+        game.death, game.points, game.turns, game.endtime
+        game.role, game.race, game.gender, game.align
+
+def main():
+    if len(sys.argv) > 1:
+        with open(sys.argv[1], "rb") as f:
+            lines = [line for line in f if line.endswith(b"\n")]
+        delim = sys.argv[2] if len(sys.argv) > 2 else "\t"
+    else:
+        lines, delim = [SAMPLE] * 20000, "\t"
+    results = {}
+    for label, replay in (("before", replay_dicts), ("after", replay_records)):
+        best = min(timeit.repeat(lambda: replay(lines, delim), number=1, repeat=15))
+        results[label] = len(lines) / best
+        print(f"{label:>6}: {results[label]:12,.0f} lines/sec")
+    print(f"speedup: {results['after'] / results['before']:.2f}x")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,78 @@
+"""Tests for LogTailer: appends, partial lines, truncation and rotation."""
+
+import os
+import sys
+import tempfile
+import unittest
+
+import test_botconf
+sys.modules.setdefault("botconf", test_botconf)
+from twisted.python import filepath
+
+import beholder
+
+
+class LogTailerTest(unittest.TestCase):
+    def setUp(self):
+        self.dir = tempfile.TemporaryDirectory()
+        self.path = os.path.join(self.dir.name, "xlogfile")
+        self.write(b"")
+        self.tailer = beholder.LogTailer(filepath.FilePath(self.path))
+
+    def tearDown(self):
+        self.tailer.close()
+        self.dir.cleanup()
+
+    def write(self, data, mode="wb", path=None):
+        with open(path or self.path, mode) as f:
+            f.write(data)
+
+    def test_appended_lines(self):
+        self.write(b"one\ntwo\n", "ab")
+        self.assertEqual(self.tailer.readLines(), [b"one\n", b"two\n"])
+        self.assertEqual(self.tailer.readLines(), [])
+        self.write(b"three\n", "ab")
+        self.assertEqual(self.tailer.readLines(), [b"three\n"])
+        self.assertEqual(self.tailer.offset, len(b"one\ntwo\nthree\n"))
+
+    def test_partial_line_waits_for_newline(self):
+        self.write(b"one\ntw", "ab")
+        self.assertEqual(self.tailer.readLines(), [b"one\n"])
+        self.assertEqual(self.tailer.offset, 4)
+        self.write(b"o\n", "ab")
+        self.assertEqual(self.tailer.readLines(), [b"two\n"])
+
+    def test_resumes_from_offset(self):
+        self.write(b"old\nnew\n")
+        tailer = beholder.LogTailer(filepath.FilePath(self.path), offset=4)
+        self.addCleanup(tailer.close)
+        self.assertEqual(tailer.readLines(), [b"new\n"])
+
+    def test_truncated_in_place(self):
+        self.write(b"one\ntwo\n", "ab")
+        self.tailer.readLines()
+        self.write(b"new\n") # shorter than what we've read
+        self.assertEqual(self.tailer.readLines(), [b"new\n"])
+        self.assertEqual(self.tailer.offset, 4)
+
+    def test_replaced_file(self):
+        self.write(b"one\n", "ab")
+        self.tailer.readLines()
+        # a last line lands in the old file, then a new one is renamed over it
+        self.write(b"two\n", "ab")
+        self.write(b"fresh\n", path=self.path + ".new")
+        os.rename(self.path + ".new", self.path)
+        self.assertEqual(self.tailer.readLines(), [b"two\n", b"fresh\n"])
+        self.write(b"more\n", "ab")
+        self.assertEqual(self.tailer.readLines(), [b"more\n"])
+
+    def test_missing_file_waits(self):
+        self.tailer.readLines()
+        os.unlink(self.path)
+        self.assertEqual(self.tailer.readLines(), [])
+        self.write(b"back\n")
+        self.assertEqual(self.tailer.readLines(), [b"back\n"])
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,105 @@
+"""Tests for OutboundQueue: pacing, priority order, coalescing and clear()."""
+
+import sys
+import unittest
+
+import test_botconf
+sys.modules.setdefault("botconf", test_botconf)
+from twisted.internet import task
+
+import beholder
+
+Q = beholder.OutboundQueue
+
+
+class OutboundQueueTest(unittest.TestCase):
+    def setUp(self):
+        self.clock = task.Clock()
+        self.sent = []
+        # 2 lines a second, bursts of 3
+        self.q = Q(self.sent.append, 2, 3, clock=self.clock)
+
+    def test_burst_then_paced(self):
+        for i in range(6):
+            self.q.put(f"line {i}", Q.REPLY)
+        self.assertEqual(self.sent, ["line 0", "line 1", "line 2"])
+        self.assertEqual(len(self.q), 3)
+        self.clock.advance(0.5)
+        self.assertEqual(self.sent[3:], ["line 3"])
+        self.clock.advance(0.5)
+        self.assertEqual(self.sent[4:], ["line 4"])
+        self.clock.advance(0.5)
+        self.assertEqual(self.sent[5:], ["line 5"])
+        self.assertEqual(len(self.q), 0)
+        self.assertFalse(self.clock.getDelayedCalls())
+
+    def test_bucket_refills_to_burst(self):
+        for i in range(3):
+            self.q.put(f"line {i}", Q.REPLY)
+        self.clock.advance(60)
+        for i in range(3, 7):
+            self.q.put(f"line {i}", Q.REPLY)
+        # only a burst's worth, however long we were idle
+        self.assertEqual(len(self.sent), 6)
+
+    def test_priority_order(self):
+        for i in range(3):
+            self.q.put(f"filler {i}", Q.REPLY) # use up the burst
+        self.q.put("forward", Q.FORWARD)
+        self.q.put("reply 1", Q.REPLY)
+        self.q.put("announce", Q.ANNOUNCE)
+        self.q.put("reply 2", Q.REPLY)
+        self.q.put("control", Q.CONTROL)
+        self.clock.pump([0.5] * 5)
+        self.assertEqual(self.sent[3:], ["control", "announce", "reply 1",
+                                         "reply 2", "forward"])
+
+    def test_coalesce_announcements_only(self):
+        for i in range(3):
+            self.q.put(f"filler {i}", Q.REPLY)
+        self.q.put("death", Q.ANNOUNCE)
+        self.q.put("death", Q.ANNOUNCE)
+        self.q.put("relay", Q.FORWARD)
+        self.q.put("relay", Q.FORWARD)
+        self.q.put("K2: pong", Q.REPLY)
+        self.q.put("K2: pong", Q.REPLY)
+        self.assertEqual(self.q.coalesced, 2)
+        self.assertEqual(len(self.q), 4)
+        self.clock.pump([0.5] * 4)
+        self.assertEqual(self.sent[3:], ["death", "K2: pong", "K2: pong", "relay"])
+        # once sent, the same announcement can be queued again
+        self.q.put("death", Q.ANNOUNCE)
+        self.clock.advance(0.5)
+        self.assertEqual(self.sent[-1], "death")
+
+    def test_unpaced(self):
+        q = Q(self.sent.append, 0, 3, clock=self.clock)
+        for i in range(10):
+            q.put("same", Q.ANNOUNCE)
+        self.assertEqual(self.sent, ["same"] * 10)
+        self.assertEqual(len(q), 0)
+        self.assertFalse(self.clock.getDelayedCalls())
+
+    def test_clear_returns_announcement_origins(self):
+        for i in range(3):
+            self.q.put(f"filler {i}", Q.REPLY)
+        self.q.put("[nh370] a died", Q.ANNOUNCE, ("a died", "nh370"))
+        self.q.put("#beholder [nh370] a died", Q.ANNOUNCE, ("a died", "nh370"))
+        self.q.put("[dnh] b died", Q.ANNOUNCE, ("b died", "dnh"))
+        self.q.put("[evil] no origin", Q.ANNOUNCE)
+        self.q.put("K2: pong", Q.REPLY)
+        self.q.put("#Q# 1 K2 status", Q.CONTROL)
+        (origins, dropped) = self.q.clear()
+        self.assertEqual(origins, [("a died", "nh370"), ("b died", "dnh")])
+        self.assertEqual(dropped, 3)
+        self.assertEqual(len(self.q), 0)
+        self.assertFalse(self.clock.getDelayedCalls())
+        # nothing more goes out, and the queue is usable again
+        self.clock.advance(10)
+        self.assertEqual(len(self.sent), 3)
+        self.q.put("[nh370] a died", Q.ANNOUNCE)
+        self.assertEqual(self.sent[-1], "[nh370] a died")
+
+
+if __name__ == "__main__":
+    unittest.main()
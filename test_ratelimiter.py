@@ -0,0 +1,201 @@
+"""Tests for RateLimiter, against the per-host dicts of lists it replaced."""
+
+import random
+import sys
+import unittest
+
+import test_botconf
+sys.modules.setdefault("botconf", test_botconf)
+
+import beholder
+from beholder import (RATE_LIMIT_WINDOW, RATE_LIMIT_COMMANDS, BURST_WINDOW,
+                      ABUSE_THRESHOLD, ABUSE_WINDOW, ABUSE_PENALTY,
+                      RESPONSE_RATE_LIMIT, RESPONSE_RATE_WINDOW)
+
+
+class Clock:
+    def __init__(self, now=1000000.0):
+        self.now = now
+
+    def __call__(self):
+        return self.now
+
+    def advance(self, seconds):
+        self.now += seconds
+
+
+class DictRateLimiter:
+    """The old _checkRateLimit and friends, as the reference behaviour."""
+    def __init__(self, clock):
+        self.clock = clock
+        self.rate_limits = {}
+        self.abuse_penalties = {}
+        self.consecutive_commands = {}
+        self.penalty_responses = {}
+        self.last_command_time = {}
+
+    def allowBurst(self, host):
+        now = self.clock()
+        if host in self.last_command_time:
+            if now - self.last_command_time[host] < BURST_WINDOW:
+                return False
+        self.last_command_time[host] = now
+        return True
+
+    def allowCommand(self, host):
+        now = self.clock()
+        if host in self.abuse_penalties:
+            if now < self.abuse_penalties[host]:
+                return False
+            del self.abuse_penalties[host]
+            self.consecutive_commands.pop(host, None)
+        stamps = [t for t in self.rate_limits.get(host, []) if now - t < RATE_LIMIT_WINDOW]
+        self.rate_limits[host] = stamps
+        if len(stamps) >= RATE_LIMIT_COMMANDS:
+            return False
+        stamps.append(now)
+        recent = [t for t in self.consecutive_commands.get(host, []) if now - t < ABUSE_WINDOW]
+        recent.append(now)
+        self.consecutive_commands[host] = recent
+        if len(recent) >= ABUSE_THRESHOLD:
+            self.abuse_penalties[host] = now + ABUSE_PENALTY
+            self.consecutive_commands[host] = []
+            return False
+        return True
+
+    def allowPenaltyMessage(self, host):
+        now = self.clock()
+        stamps = [t for t in self.penalty_responses.get(host, [])
+                  if now - t < RESPONSE_RATE_WINDOW]
+        self.penalty_responses[host] = stamps
+        if len(stamps) >= RESPONSE_RATE_LIMIT:
+            return False
+        stamps.append(now)
+        return True
+
+
+class RateLimiterTest(unittest.TestCase):
+    def setUp(self):
+        self.clock = Clock()
+        self.limiter = beholder.RateLimiter(clock=self.clock)
+
+    def command(self, host="h", limiter=None):
+        """A command as privmsg checks it: burst, then rate; None if burst-dropped"""
+        limiter = limiter or self.limiter
+        if not limiter.allowBurst(host): return None
+        return limiter.allowCommand(host)
+
+    def test_matches_dict_logic(self):
+        old = DictRateLimiter(self.clock)
+        rng = random.Random(1)
+        # steps that land exactly on, and just either side of, each window;
+        # mostly short ones, so hosts do run into penalties
+        short = [0.05, 0.5]
+        for window in (BURST_WINDOW, ABUSE_WINDOW / ABUSE_THRESHOLD):
+            short += [window - 0.01, window, window + 0.01]
+        long = []
+        for window in (ABUSE_WINDOW, RATE_LIMIT_WINDOW, RESPONSE_RATE_WINDOW,
+                       ABUSE_PENALTY, self.limiter.keep):
+            long += [window - 0.01, window, window + 0.01]
+        blocked = 0
+        for i in range(50000):
+            steps = long if rng.random() < 0.02 else short
+            self.clock.advance(rng.choice(steps))
+            host = rng.choice("abc")
+            expected = self.command(host, old)
+            self.assertEqual(self.command(host), expected, f"step {i}")
+            if expected is False:
+                blocked += 1
+                self.assertEqual(self.limiter.allowPenaltyMessage(host),
+                                 old.allowPenaltyMessage(host), f"step {i}")
+        self.assertGreater(blocked, 1000)
+
+    def test_burst_window_edge(self):
+        self.assertTrue(self.limiter.allowBurst("h"))
+        self.clock.advance(BURST_WINDOW - 0.001)
+        self.assertFalse(self.limiter.allowBurst("h"))
+        self.clock.advance(0.001)
+        self.assertTrue(self.limiter.allowBurst("h"))
+
+    def test_abuse_penalty(self):
+        spacing = ABUSE_WINDOW / ABUSE_THRESHOLD
+        for i in range(ABUSE_THRESHOLD - 1):
+            self.assertTrue(self.command())
+            self.clock.advance(spacing)
+        # the ABUSE_THRESHOLDth command inside ABUSE_WINDOW earns the penalty
+        self.assertFalse(self.command())
+        self.assertEqual(self.limiter.penaltyRemaining("h"), ABUSE_PENALTY)
+        self.assertEqual(self.limiter.penalized(), 1)
+        self.clock.advance(ABUSE_PENALTY - BURST_WINDOW)
+        self.assertFalse(self.command())
+        self.clock.advance(BURST_WINDOW)
+        self.assertIsNone(self.limiter.penaltyRemaining("h"))
+        self.assertTrue(self.command())
+        self.assertEqual(self.limiter.penalized(), 0)
+
+    def test_spaced_commands_not_penalised(self):
+        for i in range(3 * ABUSE_THRESHOLD):
+            self.assertTrue(self.command())
+            self.clock.advance(ABUSE_WINDOW / (ABUSE_THRESHOLD - 1))
+
+    def test_penalty_message_window(self):
+        for i in range(RESPONSE_RATE_LIMIT):
+            self.assertTrue(self.limiter.allowPenaltyMessage("h"))
+        self.assertFalse(self.limiter.allowPenaltyMessage("h"))
+        self.clock.advance(RESPONSE_RATE_WINDOW - 0.01)
+        self.assertFalse(self.limiter.allowPenaltyMessage("h"))
+        self.clock.advance(0.01)
+        self.assertTrue(self.limiter.allowPenaltyMessage("h"))
+
+    def test_idle_hosts_expire(self):
+        for host in "abc":
+            self.command(host)
+        self.assertEqual(len(self.limiter), 3)
+        self.clock.advance(self.limiter.keep)
+        self.command("d")
+        self.assertEqual(len(self.limiter), 1)
+        self.assertEqual(self.limiter.expired, 3)
+
+    def penalise(self, host):
+        for i in range(ABUSE_THRESHOLD):
+            self.command(host)
+            self.clock.advance(BURST_WINDOW)
+        self.assertIsNotNone(self.limiter.penaltyRemaining(host))
+
+    def test_capacity_evicts_least_recently_active(self):
+        limiter = self.limiter = beholder.RateLimiter(capacity=3, clock=self.clock)
+        for host in "abc":
+            self.command(host)
+        self.command("a") # a is now the most recently active
+        self.clock.advance(BURST_WINDOW)
+        self.command("d")
+        self.assertEqual(list(limiter.hosts), ["c", "a", "d"])
+        self.assertEqual(limiter.evicted, 1)
+        self.assertEqual(len(limiter), 3)
+
+    def test_eviction_keeps_penalty(self):
+        self.limiter = beholder.RateLimiter(capacity=2, clock=self.clock)
+        self.penalise("bad")
+        for host in "xyz":
+            self.command(host)
+        self.assertNotIn("bad", self.limiter.hosts)
+        self.assertFalse(self.command("bad"))
+        self.assertEqual(self.limiter.penalized(), 1)
+
+    def test_penalty_does_not_pin_expiry(self):
+        self.penalise("bad")
+        for host in "abc":
+            self.command(host)
+        self.clock.advance(self.limiter.keep)
+        self.command("d")
+        # bad's record went too, but not its penalty
+        self.assertEqual(list(self.limiter.hosts), ["d"])
+        self.assertEqual(self.limiter.expired, 4)
+        self.assertFalse(self.command("bad"))
+        self.clock.advance(ABUSE_PENALTY)
+        self.assertTrue(self.command("bad"))
+        self.assertEqual(self.limiter.penalized(), 0)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,93 @@
+"""Tests for TellStore, including the import from the old shelve."""
+
+import os
+import shelve
+import sys
+import tempfile
+import unittest
+
+import test_botconf
+sys.modules.setdefault("botconf", test_botconf)
+
+import beholder
+
+
+class TellStoreTest(unittest.TestCase):
+    def setUp(self):
+        self.dir = tempfile.TemporaryDirectory()
+        self.path = os.path.join(self.dir.name, "tellmsg.sqlite")
+        self.legacy = os.path.join(self.dir.name, "tellmsg")
+
+    def tearDown(self):
+        self.dir.cleanup()
+
+    def open(self):
+        store = beholder.TellStore(self.path, legacy=(self.legacy + ".db", self.legacy))
+        self.addCleanup(store.close)
+        return store
+
+    def writeShelve(self, messages):
+        # as the old !tell kept them: lowercased recipient -> list of
+        # (forwardto, sender, timestamp, message)
+        with shelve.open(self.legacy) as old:
+            for recipient, msgs in messages.items():
+                old[recipient] = msgs
+
+    def test_migrates_shelve(self):
+        self.writeShelve({"bob": [("#beholder", "K2", 100.0, "hi"),
+                                  ("bob", "alice", 200.0, "psst")],
+                          "carol": [("#beholder", "K2", 150.0, "yo")]})
+        store = self.open()
+        self.assertEqual(len(store), 3)
+        self.assertTrue(store.has("bob"))
+        self.assertTrue(store.has("carol"))
+        self.assertEqual(store.take("bob"), [("#beholder", "K2", 100.0, "hi"),
+                                             ("bob", "alice", 200.0, "psst")])
+        self.assertFalse(store.has("bob"))
+        self.assertEqual(len(store), 1)
+
+    def test_migrates_only_once(self):
+        self.writeShelve({"bob": [("#beholder", "K2", 100.0, "hi")]})
+        self.open().take("bob")
+        # the shelve is left alone, but a second start mustn't import it again
+        store = self.open()
+        self.assertEqual(len(store), 0)
+        self.assertFalse(store.has("bob"))
+
+    def test_no_shelve(self):
+        store = self.open()
+        self.assertEqual(len(store), 0)
+        self.assertEqual(store.take("bob"), [])
+
+    def test_survives_reopen(self):
+        store = self.open()
+        store.add("bob", "#beholder", "K2", 100.0, "hi")
+        store.close()
+        store = self.open()
+        self.assertEqual(len(store), 1)
+        self.assertTrue(store.has("bob"))
+        self.assertEqual(store.take("bob"), [("#beholder", "K2", 100.0, "hi")])
+
+    def test_quota(self):
+        store = self.open()
+        for i in range(beholder.MAX_TELLBUF_MESSAGES):
+            self.assertTrue(store.add("bob", "#beholder", "K2", i, "hi"))
+        self.assertFalse(store.add("carol", "#beholder", "K2", 0, "hi"))
+        self.assertFalse(store.has("carol"))
+        store.take("bob")
+        self.assertTrue(store.add("carol", "#beholder", "K2", 0, "hi"))
+
+    def test_expire(self):
+        store = self.open()
+        store.add("bob", "#beholder", "K2", 100.0, "old")
+        store.add("bob", "#beholder", "K2", 300.0, "new")
+        store.add("carol", "#beholder", "K2", 100.0, "old")
+        self.assertEqual(store.expire(200.0), 2)
+        self.assertEqual(len(store), 1)
+        self.assertTrue(store.has("bob"))
+        self.assertFalse(store.has("carol"))
+        self.assertEqual(store.take("bob"), [("#beholder", "K2", 300.0, "new")])
+
+
+if __name__ == "__main__":
+    unittest.main()